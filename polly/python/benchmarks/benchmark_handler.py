@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for lambda_fns/polly.py
+
+Replays API Gateway events through handler() with polly_c and translate_c swapped for fakes
+that answer instantly with fixed size audio, so what is measured is the handler's own overhead
+(parameter parsing, sentence splitting, SSML building, base64 encoding). Each text size runs in
+a fresh process so the peak RSS reported belongs to that size alone. No network access needed.
+
+    python benchmarks/benchmark_handler.py --sizes 100 1000 10000 --iterations 200
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import statistics
+import sys
+import time
+
+LAMBDA_FNS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_fns')
+
+SENTENCES = [
+    'The next train to arrive at platform two is the service to Belfast Central.',
+    'Please stand behind the yellow line.',
+    'This service is running approximately five minutes late.',
+    'We apologise for any inconvenience this may cause.',
+    'Passengers for the airport should change at the next stop.'
+]
+
+
+class FakeAudioStream:
+
+    def __init__(self, audio):
+        self._audio = io.BytesIO(audio)
+
+    def read(self, amt=None):
+        return self._audio.read(amt)
+
+
+class FakePolly:
+
+    def __init__(self, audio_bytes):
+        self.audio = b'\xff' * audio_bytes
+        self.calls = 0
+
+    def synthesize_speech(self, **kwargs):
+        self.calls += 1
+        return {'AudioStream': FakeAudioStream(self.audio)}
+
+
+class FakeTranslate:
+
+    def __init__(self):
+        self.calls = 0
+
+    def translate_text(self, Text, SourceLanguageCode, TargetLanguageCode):
+        self.calls += 1
+        return {'TranslatedText': Text}
+
+
+def build_text(characters):
+    text = []
+    length = 0
+    index = 0
+    while length < characters:
+        sentence = SENTENCES[index % len(SENTENCES)]
+        text.append(sentence)
+        length += len(sentence) + 1
+        index += 1
+    return ' '.join(text)[:characters]
+
+
+def build_events(text, translate):
+    events = []
+    for voice in ['Matthew', 'Joanna', 'Lupe']:
+        params = {'voice': voice}
+        if translate:
+            params['translateTo'] = 'es'
+        events.append({
+            'requestContext': {'http': {'method': 'POST', 'path': '/'}},
+            'queryStringParameters': params,
+            'body': text
+        })
+    return events
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_size(size, args, results):
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    if not args.cache:
+        os.environ['CACHE_MAX_ITEMS'] = '0'
+        os.environ['CACHE_MAX_DISK_BYTES'] = '0'
+        os.environ['TRANSLATION_MEMO_MAX_ITEMS'] = '0'
+        os.environ['TRANSLATION_MEMO_DIR'] = ''
+    sys.path.insert(0, LAMBDA_FNS)
+
+    import polly
+    polly.polly_c = FakePolly(args.audio_bytes)
+    polly.translate_c = FakeTranslate()
+
+    events = build_events(build_text(size), args.translate)
+
+    # The handler logs cache stats on every call, keep that out of the timings
+    with open(os.devnull, 'w') as devnull:
+        real_stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            for i in range(args.warmup):
+                polly.handler(events[i % len(events)], None)
+
+            latencies = []
+            started = time.perf_counter()
+            for i in range(args.iterations):
+                call_started = time.perf_counter()
+                polly.handler(events[i % len(events)], None)
+                latencies.append(time.perf_counter() - call_started)
+            elapsed = time.perf_counter() - started
+        finally:
+            sys.stdout = real_stdout
+
+    results.put({
+        'size': size,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'throughput': args.iterations / elapsed,
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'polly_calls': polly.polly_c.calls,
+        'translate_calls': polly.translate_c.calls
+    })
+
+
+def wait_for_result(process, results):
+    # A child that dies (say on import) never puts a result, so don't wait on the queue forever
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                process.join()
+                # It may have put its result and exited while we were waiting
+                try:
+                    return results.get_nowait()
+                except queue.Empty:
+                    raise RuntimeError(f'benchmark process exited with code {process.exitcode} without a result')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline latency benchmark for the Polly handler')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000],
+                        help='text sizes in characters')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--audio-bytes', type=int, default=64 * 1024,
+                        help='size of the fake audio returned for every synthesize_speech call')
+    parser.add_argument('--translate', action='store_true', help='translate every request to Spanish')
+    parser.add_argument('--cache', action='store_true', help='leave the speech cache and translation memo on')
+    parser.add_argument('--json', action='store_true', help='print results as json lines')
+    args = parser.parse_args()
+
+    # spawn rather than fork so every size starts from a clean interpreter and a fresh peak RSS
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    if not args.json:
+        print(f"{'chars':>8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'req/s':>9} {'rss MB':>8} {'polly':>7} {'translate':>10}")
+
+    for size in args.sizes:
+        process = context.Process(target=run_size, args=(size, args, results))
+        process.start()
+        try:
+            result = wait_for_result(process, results)
+        except RuntimeError as error:
+            print(f'size {size} failed: {error}, see its traceback above', file=sys.stderr)
+            sys.exit(1)
+        process.join()
+
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['size']:>8} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f} {result['mean_ms']:>9.3f} "
+                  f"{result['throughput']:>9.1f} {result['peak_rss_mb']:>8.1f} {result['polly_calls']:>7} "
+                  f"{result['translate_calls']:>10}")
+
+
+if __name__ == '__main__':
+    main()
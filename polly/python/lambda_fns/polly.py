@@ -1,11 +1,220 @@
 import boto3
 import sys
+import os
+import time
+import json
 import base64
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from segmenter import chunk_text, split_sentences
+from speech_cache import SpeechCache
+from translation_memo import TranslationMemo
 
 polly_c = boto3.client('polly')
 translate_c = boto3.client('translate')
+s3_c = boto3.client('s3')
+
+SUPPORTED_VOICES = ['Joanna', 'Matthew', 'Lupe']
+
+# Async jobs are written by Polly straight into this bucket and handed back as presigned urls
+SPEECH_BUCKET = os.environ.get('SPEECH_BUCKET')
+JOB_KEY_PREFIX = 'jobs/'
+JOB_URL_EXPIRY_SECONDS = int(os.environ.get('JOB_URL_EXPIRY_SECONDS', '3600'))
+BATCH_KEY_PREFIX = 'batches/'
+# Polly's limit on the billed characters of an asynchronous synthesis task
+MAX_JOB_CHARACTERS = int(os.environ.get('MAX_JOB_CHARACTERS', '100000'))
+MAX_BATCH_TARGETS = int(os.environ.get('MAX_BATCH_TARGETS', '20'))
+# Every target of a batch is translated, synthesized and uploaded within API Gateway's 29 second timeout
+MAX_BATCH_CHARACTERS = int(os.environ.get('MAX_BATCH_CHARACTERS', '5000'))
+
+# Lives for as long as this container stays warm, set CACHE_MAX_ITEMS and CACHE_MAX_DISK_BYTES to 0 to disable
+speech_cache = SpeechCache(max_items=int(os.environ.get('CACHE_MAX_ITEMS', '128')),
+                           max_memory_bytes=int(os.environ.get('CACHE_MAX_MEMORY_BYTES', str(32 * 1024 * 1024))),
+                           directory=os.environ.get('CACHE_DIR', '/tmp/polly-cache'),
+                           max_disk_bytes=int(os.environ.get('CACHE_MAX_DISK_BYTES', str(256 * 1024 * 1024))))
+
+# Polly bills at most 3000 characters per synthesize_speech call, longer scripts are split on sentence
+# boundaries and synthesized in parallel. boto3 clients are thread safe so the workers share polly_c
+SYNTHESIS_CHUNK_CHARACTERS = int(os.environ.get('SYNTHESIS_CHUNK_CHARACTERS', '2500'))
+synthesis_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('SYNTHESIS_WORKERS', '8')))
+
+# Batch requests fan out one worker per (voice, language) target, each of which may use synthesis_pool
+# for its chunks. Keeping the two pools separate means a busy batch can't starve its own chunks
+batch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_WORKERS', '8')))
+
+# Translations are memoized per sentence so only sentences we haven't seen go to Translate, set
+# TRANSLATION_MEMO_DIR to an empty string to keep the memo in memory only
+translation_memo = TranslationMemo(max_items=int(os.environ.get('TRANSLATION_MEMO_MAX_ITEMS', '4096')),
+                                   ttl_seconds=int(os.environ.get('TRANSLATION_MEMO_TTL_SECONDS', str(24 * 60 * 60))),
+                                   directory=os.environ.get('TRANSLATION_MEMO_DIR', '/tmp/translation-memo'))
+
+# Unseen sentences are sent to Translate newline separated, as many as fit under its 10,000 byte request limit
+TRANSLATE_BATCH_BYTES = int(os.environ.get('TRANSLATE_BATCH_BYTES', '9000'))
 
 def handler(event, context):
+    voice, translate_from, translate_to, text = parse_request(event)
+
+    # Recurring announcements are served from the cache without touching Polly or Translate
+    cache_key = speech_cache.key(voice, translate_from, translate_to, text)
+    speech, cache_status = speech_cache.get(cache_key, len(text))
+
+    if speech is None:
+        started = time.perf_counter()
+
+        # Only perform a translation if the languages are different
+        if translate_to != translate_from:
+            text = translate_text(text, translate_from, translate_to)
+
+        speech = convert_text_to_speech(voice, text)
+        speech_cache.put(cache_key, speech, time.perf_counter() - started)
+
+    print(json.dumps({'cache': cache_status,
+                      'cache_stats': speech_cache.stats(),
+                      'translation_memo_stats': translation_memo.stats()}))
+
+    return {
+        'statusCode': 200,
+        'headers': { 'Content-Type': 'audio/mpeg', 'X-Cache': cache_status },
+        'body': base64.b64encode(speech),
+        'isBase64Encoded': True
+    }
+
+def start_job_handler(event, context):
+    voice, translate_from, translate_to, text = parse_request(event)
+
+    if voice not in SUPPORTED_VOICES:
+        return json_response(400, {'message': 'Only Joanna, Matthew and Lupe support the newscaster style'})
+
+    too_long = json_response(400, {'message': f'A job can be at most {MAX_JOB_CHARACTERS} characters'})
+    if len(text) > MAX_JOB_CHARACTERS:
+        return too_long
+
+    if translate_to != translate_from:
+        text = translate_text(text, translate_from, translate_to)
+        # Translations can come back longer than what was sent
+        if len(text) > MAX_JOB_CHARACTERS:
+            return too_long
+
+    # Polly renders the audio into S3 itself so this function never holds the audio in memory
+    try:
+        response = polly_c.start_speech_synthesis_task(
+                       VoiceId=voice,
+                       Engine='neural',
+                       OutputFormat='mp3',
+                       OutputS3BucketName=SPEECH_BUCKET,
+                       OutputS3KeyPrefix=JOB_KEY_PREFIX,
+                       TextType='ssml',
+                       Text=to_ssml(text))
+    except polly_c.exceptions.TextLengthExceededException:
+        return too_long
+
+    task = response['SynthesisTask']
+    return json_response(202, {'jobId': task['TaskId'], 'status': task['TaskStatus']})
+
+def job_status_handler(event, context):
+    job_id = event['pathParameters']['jobId']
+
+    try:
+        task = polly_c.get_speech_synthesis_task(TaskId=job_id)['SynthesisTask']
+    except polly_c.exceptions.SynthesisTaskNotFoundException:
+        return json_response(404, {'message': f'No speech synthesis job {job_id}'})
+    except polly_c.exceptions.InvalidTaskIdException:
+        return json_response(400, {'message': f'{job_id} is not a valid job id'})
+
+    body = {'jobId': job_id, 'status': task['TaskStatus']}
+    if task['TaskStatus'] == 'completed':
+        # Polly names the output object <prefix><task id>.<format>
+        body['url'] = s3_c.generate_presigned_url('get_object',
+                                                  Params={'Bucket': SPEECH_BUCKET, 'Key': f'{JOB_KEY_PREFIX}{job_id}.mp3'},
+                                                  ExpiresIn=JOB_URL_EXPIRY_SECONDS)
+        body['expiresIn'] = JOB_URL_EXPIRY_SECONDS
+    elif task['TaskStatus'] == 'failed':
+        body['reason'] = task.get('TaskStatusReason')
+
+    return json_response(200, body)
+
+def batch_handler(event, context):
+    bad_request = json_response(400, {'message': 'Expected a json body of {"text": "...", "translateFrom": "en", '
+                                                 '"targets": [{"voice": "Lupe", "language": "es"}, ...]}'})
+    try:
+        request = json.loads(event['body'])
+        text = request['text']
+        translate_from = request.get('translateFrom', 'en')
+        targets = [(target.get('voice', 'Matthew'), target.get('language', translate_from)) for target in request['targets']]
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return bad_request
+
+    if not isinstance(text, str) or not text.strip() or not isinstance(translate_from, str) or \
+            not all(isinstance(voice, str) and isinstance(language, str) for voice, language in targets):
+        return bad_request
+    if len(text) > MAX_BATCH_CHARACTERS:
+        return json_response(400, {'message': f'A batch can be at most {MAX_BATCH_CHARACTERS} characters'})
+
+    # Duplicate targets would just overwrite each other's audio
+    targets = list(dict.fromkeys(targets))
+
+    if not targets or len(targets) > MAX_BATCH_TARGETS:
+        return json_response(400, {'message': f'A batch needs between 1 and {MAX_BATCH_TARGETS} targets'})
+    if any(voice not in SUPPORTED_VOICES for voice, _ in targets):
+        return json_response(400, {'message': 'Only Joanna, Matthew and Lupe support the newscaster style'})
+
+    batch_id = uuid.uuid4().hex
+    batch_prefix = f'{BATCH_KEY_PREFIX}{batch_id}/'
+
+    # Anything already in the speech cache skips translation and synthesis entirely
+    cached = {}
+    for voice, language in targets:
+        cache_key = speech_cache.key(voice, translate_from, language, text)
+        cached[(voice, language)] = speech_cache.get(cache_key, len(text))
+
+    # Translate once per target language rather than once per target
+    languages = {language for (voice, language), (speech, _) in cached.items() if speech is None}
+    translations = dict(zip(languages, batch_pool.map(
+        lambda language: text if language == translate_from else translate_text(text, translate_from, language),
+        languages)))
+
+    def render(target):
+        voice, language = target
+        speech, cache_status = cached[target]
+        if speech is None:
+            started = time.perf_counter()
+            speech = convert_text_to_speech(voice, translations[language])
+            speech_cache.put(speech_cache.key(voice, translate_from, language, text), speech, time.perf_counter() - started)
+
+        key = f'{batch_prefix}{voice}-{language}.mp3'
+        s3_c.put_object(Bucket=SPEECH_BUCKET, Key=key, Body=speech, ContentType='audio/mpeg')
+        return {
+            'voice': voice,
+            'language': language,
+            'key': key,
+            'bytes': len(speech),
+            'cache': cache_status,
+            'url': s3_c.generate_presigned_url('get_object',
+                                               Params={'Bucket': SPEECH_BUCKET, 'Key': key},
+                                               ExpiresIn=JOB_URL_EXPIRY_SECONDS)
+        }
+
+    # Each worker uploads its own audio as soon as it is ready so only in flight audio is held in memory
+    results = list(batch_pool.map(render, targets))
+
+    manifest = {
+        'batchId': batch_id,
+        'translateFrom': translate_from,
+        'translations': len(languages) - (1 if translate_from in languages else 0),
+        'expiresIn': JOB_URL_EXPIRY_SECONDS,
+        'results': results
+    }
+    s3_c.put_object(Bucket=SPEECH_BUCKET, Key=f'{batch_prefix}manifest.json',
+                    Body=json.dumps(manifest), ContentType='application/json')
+
+    print(json.dumps({'batch': batch_id,
+                      'targets': len(targets),
+                      'cache_stats': speech_cache.stats(),
+                      'translation_memo_stats': translation_memo.stats()}))
+
+    return json_response(200, manifest)
+
+def parse_request(event):
     try:
         voice = event["queryStringParameters"]["voice"]
     except KeyError:
@@ -20,43 +229,110 @@ def handler(event, context):
         translate_to = event["queryStringParameters"]["translateTo"]
     except KeyError:
         translate_to = 'en'
-        
+
     try:
         text = event['body']
     except KeyError:
         text = 'To hear your own script, you need to include text in the message body of your restful request to the API Gateway'
-        
-    # Only perform a translation if the languages are different
-    if translate_to != translate_from:
-        text = translate_text(text, translate_from, translate_to)
 
-    speech = convert_text_to_speech(voice, text)
-    
+    return voice, translate_from, translate_to, text
+
+def json_response(status_code, body):
     return {
-        'statusCode': 200,
-        'headers': { 'Content-Type': 'audio/mpeg' },
-        'body': base64.b64encode(speech),
-        'isBase64Encoded': True
+        'statusCode': status_code,
+        'headers': { 'Content-Type': 'application/json' },
+        'body': json.dumps(body)
     }
 
 def translate_text(text, translate_from, translate_to):
+    sentences = [' '.join(sentence.split()) for sentence in split_sentences(text)]
+
+    translations = {}
+    unseen = []
+    for sentence in sentences:
+        if sentence in translations:
+            continue
+        translation = translation_memo.get(translate_from, translate_to, sentence)
+        if translation is None:
+            unseen.append(sentence)
+            translations[sentence] = None
+        else:
+            translations[sentence] = translation
+
+    # Boilerplate sentences come from the memo, everything else is translated in as few calls as possible
+    fresh = {}
+    for batch in batch_sentences(unseen, TRANSLATE_BATCH_BYTES):
+        fresh.update(translate_batch(batch, translate_from, translate_to))
+    translation_memo.put(translate_from, translate_to, fresh)
+    translations.update(fresh)
+
+    return ' '.join(translations[sentence] for sentence in sentences)
+
+def batch_sentences(sentences, max_bytes):
+    batch = []
+    batch_bytes = 0
+    for sentence in sentences:
+        sentence_bytes = len(sentence.encode('utf-8')) + 1
+        if batch and batch_bytes + sentence_bytes > max_bytes:
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(sentence)
+        batch_bytes += sentence_bytes
+    if batch:
+        yield batch
+
+def translate_batch(sentences, translate_from, translate_to):
+    if len(sentences) == 1:
+        return {sentences[0]: translate_sentence(sentences[0], translate_from, translate_to)}
+
     response = translate_c.translate_text(
-        Text=text,
+        Text='\n'.join(sentences),
         SourceLanguageCode=translate_from,
         TargetLanguageCode=translate_to
     )
+    translated = response['TranslatedText'].split('\n')
+
+    # Translate keeps line breaks, but if it ever merges or splits lines fall back to one call per sentence
+    if len(translated) != len(sentences):
+        return {sentence: translate_sentence(sentence, translate_from, translate_to) for sentence in sentences}
+
+    return dict(zip(sentences, (line.strip() for line in translated)))
+
+def translate_sentence(sentence, translate_from, translate_to):
+    # A single sentence can still be too big for one request, in which case it is split on whitespace
+    translated = []
+    for chunk in chunk_text(sentence, TRANSLATE_BATCH_BYTES // 4) or [sentence]:
+        response = translate_c.translate_text(
+            Text=chunk,
+            SourceLanguageCode=translate_from,
+            TargetLanguageCode=translate_to
+        )
+        translated.append(response['TranslatedText'])
 
-    return response['TranslatedText']
+    return ' '.join(translated)
 
 def convert_text_to_speech(voice, text):
-    if voice not in ['Joanna', 'Matthew', 'Lupe']:
+    if voice not in SUPPORTED_VOICES:
         print('Only Joanna, Matthew and Lupe support the newscaster style')
         sys.exit(1)
+
+    chunks = chunk_text(text, SYNTHESIS_CHUNK_CHARACTERS) or [text]
+    if len(chunks) == 1:
+        return synthesize_chunk(voice, chunks[0])
+
+    # map() yields in submission order so the mp3 frames are concatenated in script order
+    return b''.join(synthesis_pool.map(lambda chunk: synthesize_chunk(voice, chunk), chunks))
+
+def synthesize_chunk(voice, text):
     response = polly_c.synthesize_speech(
                    VoiceId=voice,
                    Engine='neural',
                    OutputFormat='mp3',
                    TextType='ssml',
-                   Text = f'<speak><amazon:domain name="news">{text}></amazon:domain></speak>')
+                   Text = to_ssml(text))
 
     return response['AudioStream'].read()
+
+def to_ssml(text):
+    return f'<speak><amazon:domain name="news">{text}></amazon:domain></speak>'
@@ -0,0 +1,50 @@
+import re
+
+# A sentence ends with terminal punctuation (optionally followed by closing quotes/brackets) and whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。！？])\s+|(?<=[.!?。！？]["\')\]])\s+|\n\s*\n')
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence and sentence.strip()]
+
+
+def chunk_text(text, max_characters):
+    """
+    Packs whole sentences into chunks of at most max_characters, only breaking
+    a sentence on whitespace (or mid word as a last resort) when it is too long on its own.
+    """
+    chunks = []
+    current = ''
+    for sentence in split_sentences(text):
+        for piece in _split_long(sentence, max_characters):
+            if current and len(current) + 1 + len(piece) > max_characters:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(sentence, max_characters):
+    if len(sentence) <= max_characters:
+        return [sentence]
+
+    pieces = []
+    current = ''
+    for word in sentence.split():
+        while len(word) > max_characters:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(word[:max_characters])
+            word = word[max_characters:]
+        if current and len(current) + 1 + len(word) > max_characters:
+            pieces.append(current)
+            current = word
+        else:
+            current = f'{current} {word}' if current else word
+    if current:
+        pieces.append(current)
+    return pieces
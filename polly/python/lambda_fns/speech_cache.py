@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class SpeechCache:
+    """
+    Two tier cache of synthesized mp3 audio keyed by a hash of the normalized request.
+
+    Tier 1 is a bounded LRU held in the memory of the warm Lambda container, tier 2 is
+    a directory in /tmp that survives for the life of the execution environment and is
+    evicted oldest first once it grows past max_disk_bytes.
+
+    Batch requests use it from several threads at once, so every public method holds a lock.
+    """
+
+    def __init__(self, max_items=128, max_memory_bytes=32 * 1024 * 1024,
+                 directory='/tmp/polly-cache', max_disk_bytes=256 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+
+        # Running totals so we can see how much Polly / Translate time and spend the cache saved
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.saved_characters = 0
+
+    @staticmethod
+    def key(voice, translate_from, translate_to, text):
+        # Collapse whitespace so trivially different request bodies share an entry
+        normalized = ' '.join(text.split())
+        if translate_from == translate_to:
+            translate_from = translate_to = None
+        payload = json.dumps([voice, translate_from, translate_to, normalized])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key, characters=0):
+        with self._lock:
+            return self._get(key, characters)
+
+    def _get(self, key, characters):
+        speech = self._memory.get(key)
+        if speech is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.saved_characters += characters
+            return speech, 'HIT-MEMORY'
+
+        speech = self._read_disk(key)
+        if speech is not None:
+            self._remember(key, speech)
+            self.disk_hits += 1
+            self.saved_characters += characters
+            return speech, 'HIT-DISK'
+
+        self.misses += 1
+        return None, 'MISS'
+
+    def put(self, key, speech, elapsed_seconds=0.0):
+        with self._lock:
+            self.miss_seconds += elapsed_seconds
+            self._remember(key, speech)
+            self._write_disk(key, speech)
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        hits = self.memory_hits + self.disk_hits
+        average_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_bytes': self._disk_bytes or 0,
+            'saved_characters': self.saved_characters,
+            'estimated_saved_seconds': round(hits * average_miss_seconds, 3)
+        }
+
+    def _remember(self, key, speech):
+        if self.max_items <= 0 or len(speech) > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = speech
+        self._memory_bytes += len(speech)
+        while len(self._memory) > self.max_items or self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.mp3')
+
+    # The disk tier is best effort, any filesystem error just behaves like a miss
+    def _read_disk(self, key):
+        if self.max_disk_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                speech = cached.read()
+            # Touch the file so eviction treats it as recently used
+            os.utime(path)
+            return speech
+        except OSError:
+            return None
+
+    def _write_disk(self, key, speech):
+        if self.max_disk_bytes <= 0 or len(speech) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._measure_disk()
+            if os.path.exists(path):
+                return
+            # Write then rename so a concurrent reader never sees a partial mp3
+            partial = path + '.partial'
+            with open(partial, 'wb') as cached:
+                cached.write(speech)
+            os.replace(partial, path)
+            self._disk_bytes += len(speech)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.mp3'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _measure_disk(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self):
+        for _, size, path in sorted(self._entries()):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
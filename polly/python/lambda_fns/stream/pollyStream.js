@@ -0,0 +1,129 @@
+"use strict";
+/**
+ * Streams Polly audio straight back to the caller through a Lambda function url.
+ *
+ * Lambda response streaming is only available to the Node.js managed runtimes, which is why this
+ * one handler isn't Python. Nothing is base64 encoded or buffered, each mp3 chunk is piped to the
+ * client as Polly produces it so time to first byte doesn't grow with the length of the script.
+ */
+const { PollyClient, SynthesizeSpeechCommand } = require('@aws-sdk/client-polly');
+const { TranslateClient, TranslateTextCommand } = require('@aws-sdk/client-translate');
+const { pipeline } = require('stream/promises');
+
+const polly = new PollyClient({});
+const translate = new TranslateClient({});
+
+const validVoices = ['Joanna', 'Matthew', 'Lupe'];
+
+// Leaves room for translations to grow and still fit under Polly's 3000 billed characters per request
+const chunkCharacters = parseInt(process.env.SYNTHESIS_CHUNK_CHARACTERS || '2000', 10);
+
+exports.handler = awslambda.streamifyResponse(async (event, responseStream) => {
+    const query = event.queryStringParameters || {};
+    const voice = query.voice || 'Matthew';
+    const translateFrom = query.translateFrom || 'en';
+    const translateTo = query.translateTo || 'en';
+
+    let text = event.body || 'To hear your own script, you need to include text in the message body of your restful request to the function url';
+    if (event.isBase64Encoded) {
+        text = Buffer.from(text, 'base64').toString('utf8');
+    }
+
+    if (!validVoices.includes(voice)) {
+        const errorStream = awslambda.HttpResponseStream.from(responseStream, {
+            statusCode: 400,
+            headers: { 'Content-Type': 'text/plain' }
+        });
+        errorStream.end('Only Joanna, Matthew and Lupe support the newscaster style');
+        return;
+    }
+
+    const synthesize = async (chunk) => {
+        // Only perform a translation if the languages are different
+        if (translateTo !== translateFrom) {
+            const translation = await translate.send(new TranslateTextCommand({
+                Text: chunk,
+                SourceLanguageCode: translateFrom,
+                TargetLanguageCode: translateTo
+            }));
+            chunk = translation.TranslatedText;
+        }
+
+        const synthesis = await polly.send(new SynthesizeSpeechCommand({
+            OutputFormat: 'mp3',
+            Engine: 'neural',
+            TextType: 'ssml',
+            Text: `<speak><amazon:domain name="news">${chunk}></amazon:domain></speak>`,
+            VoiceId: voice
+        }));
+        return synthesis.AudioStream;
+    };
+
+    const audioStream = awslambda.HttpResponseStream.from(responseStream, {
+        statusCode: 200,
+        headers: { 'Content-Type': 'audio/mpeg' }
+    });
+
+    // The next chunk is requested while the current one is being piped so Polly is never idle,
+    // but at most two chunks are in flight which keeps memory flat regardless of script length
+    const chunks = chunkText(text, chunkCharacters);
+    // A prefetched chunk can fail while the one before it is still being piped. Mark it handled so
+    // that isn't an unhandled rejection (which would kill the runtime), it is still thrown when awaited
+    const prefetch = (chunk) => {
+        const promise = synthesize(chunk);
+        promise.catch(() => {});
+        return promise;
+    };
+    try {
+        let next = prefetch(chunks[0]);
+        for (let index = 0; index < chunks.length; index++) {
+            const current = await next;
+            if (index + 1 < chunks.length) {
+                next = prefetch(chunks[index + 1]);
+            }
+            await pipeline(current, audioStream, { end: false });
+        }
+        audioStream.end();
+    } catch (error) {
+        // The 200 and some audio may already be on their way, so all we can do is cut the stream short
+        console.error(error);
+        audioStream.destroy(error);
+    }
+});
+
+/**
+ * Packs whole sentences into chunks of at most maxCharacters, only splitting a sentence on
+ * whitespace when it is too long on its own.
+ */
+const chunkText = (text, maxCharacters) => {
+    const sentences = text.split(/(?<=[.!?。！？]["')\]]?)\s+|\n\s*\n/).filter((sentence) => sentence && sentence.trim());
+    const chunks = [];
+    let current = '';
+    const add = (piece) => {
+        if (current && current.length + 1 + piece.length > maxCharacters) {
+            chunks.push(current);
+            current = piece;
+        } else {
+            current = current ? `${current} ${piece}` : piece;
+        }
+    };
+    for (const sentence of sentences) {
+        if (sentence.length <= maxCharacters) {
+            add(sentence.trim());
+            continue;
+        }
+        for (let word of sentence.split(/\s+/)) {
+            while (word.length > maxCharacters) {
+                add(word.slice(0, maxCharacters));
+                word = word.slice(maxCharacters);
+            }
+            if (word) {
+                add(word);
+            }
+        }
+    }
+    if (current) {
+        chunks.push(current);
+    }
+    return chunks.length ? chunks : [text];
+};
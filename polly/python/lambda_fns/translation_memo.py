@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# The language codes Amazon Translate takes (en, es, zh-TW, ...), anything else never reaches the file system
+LANGUAGE_CODE = re.compile(r'^[a-zA-Z-]{2,10}$')
+
+
+class TranslationMemo:
+    """
+    Sentence level translation memory shared by every language pair, held as an LRU with a TTL.
+
+    When a directory is given each language pair is also persisted to /tmp as a small json
+    file, so a container that is recycled onto the same execution environment starts warm.
+
+    Batch requests translate from several threads at once, so every public method holds a lock.
+    """
+
+    def __init__(self, max_items=4096, ttl_seconds=24 * 60 * 60, directory=None):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+
+        self._entries = OrderedDict()
+        self._loaded_pairs = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.translated_characters = 0
+        self.saved_characters = 0
+
+    def get(self, translate_from, translate_to, sentence):
+        with self._lock:
+            return self._get(translate_from, translate_to, sentence)
+
+    def _get(self, translate_from, translate_to, sentence):
+        pair = (translate_from, translate_to)
+        self._load(pair)
+
+        key = (pair, sentence)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, translation = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_characters += len(sentence)
+                return translation
+            del self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, translate_from, translate_to, translations):
+        pair = (translate_from, translate_to)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for sentence, translation in translations.items():
+                self.translated_characters += len(sentence)
+                self._remember((pair, sentence), expires_at, translation)
+            self._save(pair)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'items': len(self._entries),
+                'translated_characters': self.translated_characters,
+                'saved_characters': self.saved_characters
+            }
+
+    def _remember(self, key, expires_at, translation):
+        if self.max_items <= 0:
+            return
+        self._entries[key] = (expires_at, translation)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+    def _path(self, pair):
+        # Pairs come straight from the request, one that isn't a pair of language codes is kept in memory only
+        if not self.directory or not all(isinstance(code, str) and LANGUAGE_CODE.match(code) for code in pair):
+            return None
+        return os.path.join(self.directory, f'{pair[0]}-{pair[1]}.json')
+
+    # Persistence is best effort, a missing, corrupt or unexpected file just means a cold memo
+    def _load(self, pair):
+        if pair in self._loaded_pairs:
+            return
+        self._loaded_pairs.add(pair)
+        path = self._path(pair)
+        if path is None:
+            return
+        try:
+            with open(path) as memo_file:
+                persisted = json.load(memo_file)
+            entries = [(sentence, float(expires_at), translation)
+                       for sentence, (expires_at, translation) in persisted.items()
+                       if isinstance(sentence, str) and isinstance(translation, str)]
+        except (OSError, ValueError, TypeError, AttributeError):
+            return
+        now = time.time()
+        for sentence, expires_at, translation in entries:
+            if expires_at > now and (pair, sentence) not in self._entries:
+                self._remember((pair, sentence), expires_at, translation)
+
+    def _save(self, pair):
+        path = self._path(pair)
+        if path is None:
+            return
+        entries = {sentence: list(entry) for (entry_pair, sentence), entry in self._entries.items() if entry_pair == pair}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.partial', 'w') as memo_file:
+                json.dump(entries, memo_file)
+            os.replace(path + '.partial', path)
+        except OSError:
+            pass
@@ -3,6 +3,7 @@ from aws_cdk import (
     aws_apigatewayv2 as api_gw,
     aws_apigatewayv2_integrations as integrations,
     aws_iam as iam,
+    aws_s3 as s3,
     core
 )
 
@@ -12,12 +13,54 @@ class PollyStack(core.Stack):
     def __init__(self, scope: core.Construct, id: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # Bucket that async speech synthesis jobs write their audio into
+        speech_bucket = s3.Bucket(self, 'SpeechBucket',
+                                  removal_policy=core.RemovalPolicy.DESTROY,
+                                  lifecycle_rules=[s3.LifecycleRule(expiration=core.Duration.days(7))])
+
         # Lambda Function that takes in text and returns a polly voice synthesis
         polly_lambda = _lambda.Function(self, 'pollyHandler',
                                         runtime=_lambda.Runtime.PYTHON_3_8,
                                         code=_lambda.Code.from_asset('lambda_fns'),
                                         handler='polly.handler')
 
+        # Lambda Functions that start a long form synthesis job and report on its progress
+        job_lambda = _lambda.Function(self, 'pollyJobHandler',
+                                      runtime=_lambda.Runtime.PYTHON_3_8,
+                                      code=_lambda.Code.from_asset('lambda_fns'),
+                                      handler='polly.start_job_handler',
+                                      timeout=core.Duration.seconds(30),
+                                      environment={
+                                          'SPEECH_BUCKET': speech_bucket.bucket_name
+                                      })
+
+        job_status_lambda = _lambda.Function(self, 'pollyJobStatusHandler',
+                                             runtime=_lambda.Runtime.PYTHON_3_8,
+                                             code=_lambda.Code.from_asset('lambda_fns'),
+                                             handler='polly.job_status_handler',
+                                             environment={
+                                                 'SPEECH_BUCKET': speech_bucket.bucket_name
+                                             })
+
+        # Lambda Function that renders the same text in several voices / languages and stores the results in s3
+        batch_lambda = _lambda.Function(self, 'pollyBatchHandler',
+                                        runtime=_lambda.Runtime.PYTHON_3_8,
+                                        code=_lambda.Code.from_asset('lambda_fns'),
+                                        handler='polly.batch_handler',
+                                        memory_size=512,
+                                        timeout=core.Duration.seconds(29),
+                                        environment={
+                                            'SPEECH_BUCKET': speech_bucket.bucket_name
+                                        })
+
+        # Lambda Function that streams the audio back through a function url as Polly produces it.
+        # Response streaming is only supported by the Node.js runtimes so this one is JavaScript
+        stream_lambda = _lambda.Function(self, 'pollyStreamHandler',
+                                         runtime=_lambda.Runtime('nodejs18.x', _lambda.RuntimeFamily.NODEJS),
+                                         code=_lambda.Code.from_asset('lambda_fns/stream'),
+                                         handler='pollyStream.handler',
+                                         timeout=core.Duration.minutes(5))
+
         # https://docs.aws.amazon.com/polly/latest/dg/api-permissions-reference.html
         # https://docs.aws.amazon.com/translate/latest/dg/translate-api-permissions-ref.html
         polly_policy = iam.PolicyStatement(effect=iam.Effect.ALLOW,
@@ -25,9 +68,60 @@ class PollyStack(core.Stack):
                                            actions=['translate:TranslateText',
                                                     'polly:SynthesizeSpeech'])
         polly_lambda.add_to_role_policy(polly_policy)
+        stream_lambda.add_to_role_policy(polly_policy)
+        batch_lambda.add_to_role_policy(polly_policy)
+        # Writes the audio and manifest, then presigns urls to read them back
+        speech_bucket.grant_read_write(batch_lambda)
+
+        job_policy = iam.PolicyStatement(effect=iam.Effect.ALLOW,
+                                         resources=['*'],
+                                         actions=['translate:TranslateText',
+                                                  'polly:StartSpeechSynthesisTask'])
+        job_lambda.add_to_role_policy(job_policy)
+        # Polly writes the output object using the permissions of the caller
+        speech_bucket.grant_put(job_lambda)
+
+        job_status_policy = iam.PolicyStatement(effect=iam.Effect.ALLOW,
+                                                resources=['*'],
+                                                actions=['polly:GetSpeechSynthesisTask'])
+        job_status_lambda.add_to_role_policy(job_status_policy)
+        # The presigned urls are signed with this function's credentials
+        speech_bucket.grant_read(job_status_lambda)
 
         # defines an API Gateway Http API resource backed by our "efs_lambda" function.
         api = api_gw.HttpApi(self, 'Polly',
                              default_integration=integrations.LambdaProxyIntegration(handler=polly_lambda))
 
+        api.add_routes(path='/jobs',
+                       methods=[api_gw.HttpMethod.POST],
+                       integration=integrations.LambdaProxyIntegration(handler=job_lambda))
+
+        api.add_routes(path='/jobs/{jobId}',
+                       methods=[api_gw.HttpMethod.GET],
+                       integration=integrations.LambdaProxyIntegration(handler=job_status_lambda))
+
+        api.add_routes(path='/batch',
+                       methods=[api_gw.HttpMethod.POST],
+                       integration=integrations.LambdaProxyIntegration(handler=batch_lambda))
+
+        # API Gateway buffers responses so the streaming function is exposed through a function url instead.
+        # The CDK version this pattern uses predates function urls, hence the raw CloudFormation resources
+        stream_url = core.CfnResource(self, 'pollyStreamUrl',
+                                      type='AWS::Lambda::Url',
+                                      properties={
+                                          'TargetFunctionArn': stream_lambda.function_arn,
+                                          'AuthType': 'NONE',
+                                          'InvokeMode': 'RESPONSE_STREAM'
+                                      })
+
+        core.CfnResource(self, 'pollyStreamUrlPermission',
+                         type='AWS::Lambda::Permission',
+                         properties={
+                             'Action': 'lambda:InvokeFunctionUrl',
+                             'FunctionName': stream_lambda.function_name,
+                             'Principal': '*',
+                             'FunctionUrlAuthType': 'NONE'
+                         })
+
         core.CfnOutput(self, 'HTTP API Url', value=api.url)
+        core.CfnOutput(self, 'Streaming Url', value=core.Token.as_string(stream_url.get_att('FunctionUrl')))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Write contention benchmark for lambda_fns/message_wall.py
+
+Runs many processes POSTing to a wall in a local directory (standing in for /mnt/msg) once per
+shard count, so the throughput of one shared flock can be compared with a sharded wall. Local
+disks are far quicker than EFS, so --hold-ms can be used to keep each write's lock held for
+roughly the round trip an NFS write would take.
+
+    python benchmarks/shard_contention.py --processes 16 --messages 200 --shards 1 8 --hold-ms 2
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+
+LAMBDA_FNS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_fns')
+
+
+def writer(worker, directory, shard_count, messages, hold_ms, start, results):
+    os.environ['MSG_DIR'] = directory
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    sys.path.insert(0, LAMBDA_FNS)
+    import message_wall
+
+    # Stand in for one Lambda container per process, spread evenly over the shards
+    message_wall.WRITER_SHARD = worker % shard_count
+
+    if hold_ms:
+        enter = message_wall.ShardLock.__enter__
+
+        def slow_enter(self):
+            locked = enter(self)
+            if self.mode == message_wall.fcntl.LOCK_EX:
+                time.sleep(hold_ms / 1000)
+            return locked
+
+        message_wall.ShardLock.__enter__ = slow_enter
+
+    start.wait()
+    latencies = []
+    for i in range(messages):
+        started = time.perf_counter()
+        message_wall.add_message(f'worker {worker} message {i}')
+        latencies.append(time.perf_counter() - started)
+    results.put(latencies)
+
+
+def wait_for_result(workers, results):
+    # A writer that dies (say on import) never puts a result, so don't wait on the queue forever
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            failed = [process for process in workers if process.exitcode not in (None, 0)]
+            if failed:
+                for process in workers:
+                    process.terminate()
+                raise RuntimeError(f'writer exited with code {failed[0].exitcode} without a result')
+
+
+def run(shard_count, args):
+    directory = tempfile.mkdtemp(prefix='message-wall-')
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=writer, args=(worker, directory, shard_count, args.messages, args.hold_ms, start, results))
+               for worker in range(args.processes)]
+    for process in workers:
+        process.start()
+
+    # Give every process time to import before the clock starts
+    time.sleep(1)
+    started = time.perf_counter()
+    start.set()
+    latencies = []
+    for _ in workers:
+        latencies.extend(wait_for_result(workers, results))
+    elapsed = time.perf_counter() - started
+    for process in workers:
+        process.join()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    latencies.sort()
+    return {
+        'shards': shard_count,
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'ops_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent POST throughput of the EFS message wall by shard count')
+    parser.add_argument('--processes', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=200, help='messages posted by each process')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--hold-ms', type=float, default=0, help='extra time each write holds its lock for')
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} {'ops':>7} {'seconds':>8} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for shard_count in args.shards:
+        try:
+            result = run(shard_count, args)
+        except RuntimeError as error:
+            print(f'{error}, see its traceback above', file=sys.stderr)
+            sys.exit(1)
+        print(f"{result['shards']:>6} {result['ops']:>7} {result['seconds']:>8.2f} {result['ops_per_second']:>9.1f} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Mixed workload benchmark for lambda_fns/message_wall.py
+
+Runs lambda_handler in many processes against a wall in a local directory (standing in for
+/mnt/msg), once for every combination of request mix and starting wall size, and reports
+throughput, latency percentiles per method and how long requests spent waiting on shard locks.
+It only needs a plain Linux box, so it gives a baseline to compare any storage change against.
+
+    python benchmarks/wall_benchmark.py --processes 8 --requests 500 --mix 90:9:1 50:50:0 --wall-sizes 0 100000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+LAMBDA_FNS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_fns')
+
+METHODS = ['GET', 'POST', 'DELETE']
+
+
+def load_wall(directory, shard_count):
+    os.environ['MSG_DIR'] = directory
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    sys.path.insert(0, LAMBDA_FNS)
+    import message_wall
+    return message_wall
+
+
+def populate(directory, shard_count, size):
+    message_wall = load_wall(directory, shard_count)
+    batch = 10000
+    for written in range(0, size, batch):
+        message_wall.WRITER_SHARD = (written // batch) % shard_count
+        message_wall.add_messages([f'seed message {i}' for i in range(written, min(size, written + batch))])
+
+
+def request(method, params=None, body=None):
+    return {'requestContext': {'http': {'method': method}}, 'rawPath': '/',
+            'queryStringParameters': params, 'headers': {}, 'body': body}
+
+
+def worker(number, directory, shard_count, weights, requests, hold_ms, start, results):
+    message_wall = load_wall(directory, shard_count)
+    message_wall.WRITER_SHARD = number % shard_count
+
+    # Time spent inside ShardLock.__enter__ is time spent waiting for (and taking) the flock
+    lock_wait = defaultdict(float)
+    enter = message_wall.ShardLock.__enter__
+
+    def timed_enter(self):
+        started = time.perf_counter()
+        locked = enter(self)
+        lock_wait['exclusive' if self.mode == message_wall.fcntl.LOCK_EX else 'shared'] += time.perf_counter() - started
+        if hold_ms and self.mode == message_wall.fcntl.LOCK_EX:
+            time.sleep(hold_ms / 1000)
+        return locked
+
+    message_wall.ShardLock.__enter__ = timed_enter
+
+    generator = random.Random(number)
+    posted = []
+    latencies = defaultdict(list)
+    start.wait()
+    for i in range(requests):
+        method = generator.choices(METHODS, weights)[0]
+        if method == 'GET':
+            event = request('GET', {'limit': '100'})
+        elif method == 'POST':
+            event = request('POST', body=f'worker {number} message {i}')
+        else:
+            # Deletes pick one of this worker's own messages so the wall size stays roughly steady
+            if not posted:
+                continue
+            event = request('DELETE', {'id': posted.pop(generator.randrange(len(posted)))})
+
+        started = time.perf_counter()
+        response = message_wall.lambda_handler(event, None)
+        latencies[method].append(time.perf_counter() - started)
+        if method == 'POST':
+            posted.append(response['headers']['X-Message-Id'])
+
+    results.put((dict(latencies), dict(lock_wait)))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def wait_for_result(workers, results):
+    # A worker that dies (say on import) never puts a result, so don't wait on the queue forever
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            failed = [process for process in workers if process.exitcode not in (None, 0)]
+            if failed:
+                for process in workers:
+                    process.terminate()
+                raise RuntimeError(f'benchmark worker exited with code {failed[0].exitcode} without a result')
+
+
+def run(seed_directory, mix, size, args):
+    directory = tempfile.mkdtemp(prefix='message-wall-')
+    shutil.rmtree(directory)
+    shutil.copytree(seed_directory, directory)
+
+    weights = [float(weight) for weight in mix.split(':')]
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(number, directory, args.shards, weights, args.requests,
+                                                     args.hold_ms, start, results))
+               for number in range(args.processes)]
+    for process in workers:
+        process.start()
+
+    # Give every process time to import before the clock starts
+    time.sleep(1)
+    started = time.perf_counter()
+    start.set()
+    latencies = defaultdict(list)
+    lock_wait = defaultdict(float)
+    for _ in workers:
+        worker_latencies, worker_lock_wait = wait_for_result(workers, results)
+        for method, values in worker_latencies.items():
+            latencies[method].extend(values)
+        for mode, seconds in worker_lock_wait.items():
+            lock_wait[mode] += seconds
+    elapsed = time.perf_counter() - started
+    for process in workers:
+        process.join()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    everything = sorted(value for values in latencies.values() for value in values)
+    busy = sum(everything)
+    result = {
+        'mix': mix,
+        'wall_size': size,
+        'ops': len(everything),
+        'seconds': round(elapsed, 3),
+        'ops_per_second': round(len(everything) / elapsed, 1),
+        'p50_ms': round(percentile(everything, 0.5), 3),
+        'p99_ms': round(percentile(everything, 0.99), 3),
+        'shared_lock_wait_ms': round(lock_wait['shared'] * 1000, 1),
+        'exclusive_lock_wait_ms': round(lock_wait['exclusive'] * 1000, 1),
+        # Share of all request time spent waiting on locks
+        'lock_wait_share': round((lock_wait['shared'] + lock_wait['exclusive']) / busy, 3) if busy else 0.0
+    }
+    for method in METHODS:
+        values = sorted(latencies[method])
+        result[method.lower()] = {'ops': len(values),
+                                  'p50_ms': round(percentile(values, 0.5), 3),
+                                  'p99_ms': round(percentile(values, 0.99), 3)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed GET/POST/DELETE benchmark of the EFS message wall')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests made by each process')
+    parser.add_argument('--mix', nargs='+', default=['90:9:1', '50:45:5'], help='GET:POST:DELETE weights')
+    parser.add_argument('--wall-sizes', type=int, nargs='+', default=[0, 100000], help='messages on the wall before starting')
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--hold-ms', type=float, default=0, help='extra time each write holds its lock for')
+    parser.add_argument('--json', action='store_true', help='print one JSON result per line instead of a table')
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'mix':>10} {'wall':>9} {'ops':>7} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'GET p99':>8} {'POST p99':>9} {'DEL p99':>8} {'sh wait ms':>11} {'ex wait ms':>11} {'wait %':>7}")
+
+    context = multiprocessing.get_context('spawn')
+    for size in args.wall_sizes:
+        # Each wall size is written once and copied for every mix
+        seed_directory = tempfile.mkdtemp(prefix='message-wall-seed-')
+        if size:
+            populator = context.Process(target=populate, args=(seed_directory, args.shards, size))
+            populator.start()
+            populator.join()
+            # A seed that failed would leave a smaller wall benchmarked under this size
+            if populator.exitcode != 0:
+                print(f'seeding a wall of {size} messages exited with code {populator.exitcode}, see its traceback above',
+                      file=sys.stderr)
+                shutil.rmtree(seed_directory, ignore_errors=True)
+                sys.exit(1)
+
+        for mix in args.mix:
+            try:
+                result = run(seed_directory, mix, size, args)
+            except RuntimeError as error:
+                print(f'{error}, see its traceback above', file=sys.stderr)
+                sys.exit(1)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{result['mix']:>10} {result['wall_size']:>9} {result['ops']:>7} {result['ops_per_second']:>9.1f} "
+                      f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['get']['p99_ms']:>8.2f} "
+                      f"{result['post']['p99_ms']:>9.2f} {result['delete']['p99_ms']:>8.2f} "
+                      f"{result['shared_lock_wait_ms']:>11.1f} {result['exclusive_lock_wait_ms']:>11.1f} "
+                      f"{result['lock_wait_share'] * 100:>6.1f}%")
+
+        shutil.rmtree(seed_directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,726 @@
 import os
 import fcntl
+import hashlib
+import heapq
+import json
+import mmap
+import struct
+import time
+import zlib
 
-MSG_FILE_PATH = '/mnt/msg/content'
+MSG_DIR = os.environ.get('MSG_DIR', '/mnt/msg')
+WALL_DIR = os.path.join(MSG_DIR, 'wall')
 
+# Where the wall was kept before it was a log, one message per line. Whatever is in it is imported
+# into shard 0 the first time a container handles a request, then it is removed
+LEGACY_PATH = os.path.join(MSG_DIR, 'content')
 
-def get_messages():
+# The wall is split into shards, each with its own lock, so concurrent POSTs from many Lambda
+# containers don't all queue on a single flock. A container always writes to the same shard
+# (picked from its log stream name) and reads merge every shard back together by timestamp.
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '8'))
+WRITER_SHARD = zlib.crc32(os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME', str(os.getpid())).encode('utf-8')) % SHARD_COUNT
+
+# Each shard is an append only log split into segments. Every message is appended to a segment's .log
+# file and gets a fixed size entry (timestamp, byte offset, length) in the matching .idx file, so a page
+# of messages can be found and read without scanning the log. Segments are named after the sequence
+# number (within the shard) of their first message, plus a generation once compaction has rewritten them.
+INDEX_ENTRY = struct.Struct('>QQI')
+SEGMENT_NAME_DIGITS = 20
+
+# Deleted messages keep their index entry (so sequence numbers never move) with this length
+DELETED = 0xFFFFFFFF
+
+# Once the active segment's log passes this size new messages go into a fresh segment, the old one is
+# sealed and only ever touched again by deletes and compaction
+SEGMENT_MAX_BYTES = int(os.environ.get('SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Batch POSTs (to /batch) write all their messages with one locked write. Writes are only fsynced when
+# FSYNC_WRITES is set or a batch asks for it with ?fsync=true
+MAX_BATCH_MESSAGES = int(os.environ.get('MAX_BATCH_MESSAGES', '10000'))
+FSYNC_WRITES = os.environ.get('FSYNC_WRITES', 'false').lower() == 'true'
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = 1000
+
+# How many of the newest messages per shard a warm container keeps in memory, 0 turns the cache off
+CACHE_MESSAGES = int(os.environ.get('CACHE_MESSAGES', str(MAX_PAGE_SIZE)))
+
+
+class ShardLock:
+
+    def __init__(self, shard, mode, path=None):
+        self.shard = shard
+        self.mode = mode
+        self.path = path or shard.lock_path
+
+    def __enter__(self):
+        os.makedirs(self.shard.directory, exist_ok=True)
+        self.lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(self.lock_file, self.mode)
+        except OSError:
+            self.lock_file.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+class TailCache:
+    """
+    The newest messages of a shard, held for as long as the container stays warm. It is validated
+    on every request against the (inode, size, mtime_ns) of the shard's newest index file: an
+    unchanged index is served from memory, a grown one only has the appended tail read, and
+    anything else (a delete, a truncation or a new segment) rebuilds the cache from scratch.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.version = None
+        self.size = 0
+        self.mtime_ns = 0
+        self.start = 0
+        self.messages = []
+
+        self.hits = 0
+        self.tail_reads = 0
+        self.full_reads = 0
+
+    @property
+    def end(self):
+        return self.start + len(self.messages)
+
+    def refresh(self, shard, segments):
+        last_base, last_generation, last_length = segments[-1]
+        stat = os.stat(shard.segment_path(last_base, last_generation, 'idx'))
+        version = (segments[0][0], last_base, last_generation, stat.st_ino)
+        total = last_base + last_length
+
+        if version == self.version and stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns:
+            self.hits += 1
+            return
+
+        appended = None
+        if version == self.version and stat.st_size > self.size and self.messages:
+            # Re-read the last cached message too, if the inode was recycled by a delete it won't match
+            appended = shard.read_range(segments, self.end - 1, total)
+            if appended[:1] != self.messages[-1:]:
+                appended = None
+
+        if appended is not None:
+            self.messages.extend(appended[1:])
+            self.tail_reads += 1
+        else:
+            self.start = max(0, total - self.capacity)
+            self.messages = shard.read_range(segments, self.start, total)
+            self.full_reads += 1
+
+        if len(self.messages) > self.capacity:
+            trim = len(self.messages) - self.capacity
+            self.messages = self.messages[trim:]
+            self.start += trim
+
+        self.version = version
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+
+    def covers(self, start, end):
+        return self.start <= start and end <= self.end
+
+    def slice(self, start, end):
+        return self.messages[start - self.start:end - self.start]
+
+
+class Shard:
+
+    def __init__(self, number):
+        self.number = number
+        self.directory = os.path.join(WALL_DIR, f'shard-{number:03d}')
+        self.lock_path = os.path.join(self.directory, 'shard.lock')
+        # Only one compaction runs on a shard at a time, without holding up readers and writers
+        self.compaction_lock_path = os.path.join(self.directory, 'compact.lock')
+        self.cache = TailCache(CACHE_MESSAGES)
+
+    def lock(self, mode):
+        return ShardLock(self, mode)
+
+    def segment_path(self, base_seq, generation, extension):
+        suffix = f'.{generation:04d}' if generation else ''
+        return os.path.join(self.directory, f'{base_seq:0{SEGMENT_NAME_DIGITS}d}{suffix}.{extension}')
+
+    def segments(self):
+        """
+        Returns (base_seq, generation, length) for every segment, oldest first. A segment only exists
+        once its .idx file does, and when compaction has left both a merged segment and the segments
+        it replaced behind (i.e. it was interrupted) the merged one wins.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        generations = {}
+        for name in names:
+            if name.endswith('.idx'):
+                parts = name[:-4].split('.')
+                base_seq = int(parts[0])
+                generation = int(parts[1]) if len(parts) > 1 else 0
+                generations[base_seq] = max(generation, generations.get(base_seq, 0))
+
+        segments = []
+        covered = 0
+        for base_seq in sorted(generations):
+            if base_seq < covered:
+                continue
+            generation = generations[base_seq]
+            length = os.path.getsize(self.segment_path(base_seq, generation, 'idx')) // INDEX_ENTRY.size
+            segments.append((base_seq, generation, length))
+            covered = base_seq + length
+        return segments
+
+    def read_segment(self, base_seq, generation, first, last):
+        # Maps the segment and slices out messages first..last (inclusive, relative to the segment), so
+        # only the pages holding them are read however large the segment has grown
+        with open(self.segment_path(base_seq, generation, 'idx'), 'rb') as idx_file, \
+                mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ) as idx_map:
+            index = idx_map[first * INDEX_ENTRY.size:(last + 1) * INDEX_ENTRY.size]
+        entries = [INDEX_ENTRY.unpack_from(index, i) for i in range(0, len(index), INDEX_ENTRY.size)]
+
+        live = [(offset, length) for _, offset, length in entries if length != DELETED]
+        data = b''
+        if live:
+            start = live[0][0]
+            end = live[-1][0] + live[-1][1]
+            if end > start:
+                with open(self.segment_path(base_seq, generation, 'log'), 'rb') as log_file, \
+                        mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                    data = log_map[start:end]
+            else:
+                start = end
+
+        # Deleted messages come back with no text so they still take part in paging (and cursors move past them)
+        return [(timestamp, self.number, base_seq + first + i,
+                 None if length == DELETED else data[offset - start:offset - start + length].decode('utf-8'))
+                for i, (timestamp, offset, length) in enumerate(entries)]
+
+    def read_range(self, segments, start, end):
+        # Reads messages start..end-1 from whichever segments hold them
+        messages = []
+        for base_seq, generation, length in segments:
+            first = max(start, base_seq)
+            last = min(end, base_seq + length) - 1
+            if first <= last:
+                messages.extend(self.read_segment(base_seq, generation, first - base_seq, last - base_seq))
+        return messages
+
+    def page(self, limit, before=None, after=None):
+        """
+        Returns (length, messages) where messages are at most `limit` of this shard's messages as
+        (timestamp, shard, seq, text) tuples: the newest, the newest below `before`, or the oldest
+        from `after` onwards. Pages within the tail cache never touch the log.
+        """
+        with self.lock(fcntl.LOCK_SH):
+            segments = self.segments()
+            if not segments:
+                return 0, []
+
+            last_base, _, last_length = segments[-1]
+            total = last_base + last_length
+            if after is not None:
+                start = min(total, after)
+                end = min(total, start + limit)
+            else:
+                end = total if before is None else min(total, before)
+                start = max(0, end - limit)
+
+            if CACHE_MESSAGES > 0:
+                self.cache.refresh(self, segments)
+                if self.cache.covers(start, end):
+                    return total, self.cache.slice(start, end)
+
+            # Older pages than the cache holds are read straight from the log
+            return total, self.read_range(segments, start, end)
+
+    def append(self, new_message, sync=False):
+        return self.append_many([new_message], sync)[0]
+
+    def append_many(self, new_messages, sync=False):
+        """
+        Appends every message under one exclusive lock with a single write to the log and another to
+        the index, optionally fsynced, and returns their sequence numbers. A batch always lands in
+        one segment, rotation happens before it starts.
+        """
+        encoded = [new_message.encode('utf-8') for new_message in new_messages]
+        with self.lock(fcntl.LOCK_EX):
+            segments = self.segments()
+            base_seq, generation, length = segments[-1] if segments else (0, 0, 0)
+
+            # Seal the active segment once it is big enough and start a new one
+            if length and os.path.getsize(self.segment_path(base_seq, generation, 'log')) >= SEGMENT_MAX_BYTES:
+                base_seq, generation = base_seq + length, 0
+
+            with open(self.segment_path(base_seq, generation, 'log'), 'ab') as log_file, \
+                    open(self.segment_path(base_seq, generation, 'idx'), 'ab+') as idx_file:
+                position = idx_file.seek(0, os.SEEK_END) // INDEX_ENTRY.size
+                first_seq = base_seq + position
+
+                # Timestamps only ever increase within a shard, even if the containers writing to it
+                # disagree about the time, so a shard's sequence order is also its timestamp order
+                timestamp = time.time_ns()
+                if position:
+                    idx_file.seek((position - 1) * INDEX_ENTRY.size)
+                    timestamp = max(timestamp, INDEX_ENTRY.unpack(idx_file.read(INDEX_ENTRY.size))[0] + 1)
+
+                offset = log_file.seek(0, os.SEEK_END)
+                entries = []
+                for i, message in enumerate(encoded):
+                    entries.append(INDEX_ENTRY.pack(timestamp + i, offset, len(message)))
+                    offset += len(message) + 1
+
+                # Index entries are written after the messages, a crash in between leaves unindexed bytes
+                # in the log which are never read rather than index entries pointing at nothing
+                log_file.write(b''.join(message + b'\n' for message in encoded))
+                log_file.flush()
+                if sync:
+                    os.fsync(log_file.fileno())
+                idx_file.write(b''.join(entries))
+                idx_file.flush()
+                if sync:
+                    os.fsync(idx_file.fileno())
+        return list(range(first_seq, first_seq + len(encoded)))
+
+    def delete_message(self, seq):
+        with self.lock(fcntl.LOCK_EX):
+            segments = self.segments()
+            for base_seq, generation, length in segments:
+                if base_seq <= seq < base_seq + length:
+                    break
+            else:
+                return False
+
+            with open(self.segment_path(base_seq, generation, 'idx'), 'r+b') as idx_file:
+                idx_file.seek((seq - base_seq) * INDEX_ENTRY.size)
+                timestamp, offset, length = INDEX_ENTRY.unpack(idx_file.read(INDEX_ENTRY.size))
+                if length == DELETED:
+                    return False
+                # The message body stays in the log until compaction rewrites the segment
+                idx_file.seek((seq - base_seq) * INDEX_ENTRY.size)
+                idx_file.write(INDEX_ENTRY.pack(timestamp, offset, DELETED))
+
+            # Touch the newest index so tail caches and ETags notice, even if the message was in a sealed segment
+            last_base, last_generation, _ = segments[-1]
+            os.utime(self.segment_path(last_base, last_generation, 'idx'))
+        return True
+
+    def delete(self):
+        with self.lock(fcntl.LOCK_EX):
+            for name in os.listdir(self.directory):
+                if name not in ('shard.lock', 'compact.lock'):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+
+    def compact(self):
+        """
+        Merges runs of sealed segments into as few segments of up to SEGMENT_MAX_BYTES as possible,
+        dropping the bodies of deleted messages on the way. Messages are copied one at a time so
+        memory stays flat however big the shard is. The active segment is never touched.
+
+        Sealed segments only ever change by deletes marking their index entries, so they are copied
+        without holding the shard lock and GETs and POSTs carry on meanwhile. The exclusive lock is
+        only taken to pick up deletes made during the copy and to swap the merged segment in.
+        """
+        try:
+            with ShardLock(self, fcntl.LOCK_EX | fcntl.LOCK_NB, self.compaction_lock_path):
+                return self.compact_segments()
+        except BlockingIOError:
+            # Another compaction already has this shard
+            return {'shard': self.number, 'skipped': True}
+        except FileNotFoundError:
+            # The wall was deleted while we were looking at it, there is nothing left to compact
+            return {'shard': self.number, 'skipped': True}
+
+    def compact_segments(self):
+        with self.lock(fcntl.LOCK_EX):
+            self.remove_superseded(self.segments())
+
+        segments = self.segments()
+        runs = []
+        run = []
+        run_bytes = 0
+        for segment in segments[:-1]:
+            live_bytes, log_bytes = self.segment_bytes(segment)
+            if run and run_bytes + live_bytes > SEGMENT_MAX_BYTES:
+                runs.append(run)
+                run, run_bytes = [], 0
+            run.append((segment, live_bytes < log_bytes))
+            run_bytes += live_bytes
+        if run:
+            runs.append(run)
+
+        merged = 0
+        reclaimed = 0
+        for run in runs:
+            # A lone segment with nothing to drop is already as compact as it gets
+            if len(run) == 1 and not run[0][1]:
+                continue
+            reclaimed += self.merge([segment for segment, _ in run])
+            merged += len(run)
+
+        with self.lock(fcntl.LOCK_EX):
+            self.remove_superseded(self.segments())
+        return {'shard': self.number, 'segments': len(segments), 'merged': merged, 'reclaimed_bytes': reclaimed}
+
+    def segment_bytes(self, segment):
+        base_seq, generation, length = segment
+        live_bytes = 0
+        with open(self.segment_path(base_seq, generation, 'idx'), 'rb') as idx_file:
+            for _, _, message_length in INDEX_ENTRY.iter_unpack(idx_file.read(length * INDEX_ENTRY.size)):
+                if message_length != DELETED:
+                    live_bytes += message_length + 1
+        return live_bytes, os.path.getsize(self.segment_path(base_seq, generation, 'log'))
+
+    def merge(self, run):
+        base_seq, generation, _ = run[0]
+        merged_generation = generation + 1
+        merged_log = self.segment_path(base_seq, merged_generation, 'log')
+        merged_idx = self.segment_path(base_seq, merged_generation, 'idx')
+
+        old_bytes = 0
+        copied = True
+        try:
+            with open(merged_log, 'wb') as log_out, open(merged_idx + '.partial', 'wb') as idx_out:
+                for segment_base, segment_generation, length in run:
+                    log_path = self.segment_path(segment_base, segment_generation, 'log')
+                    old_bytes += os.path.getsize(log_path)
+                    with open(self.segment_path(segment_base, segment_generation, 'idx'), 'rb') as idx_in, \
+                            open(log_path, 'rb') as log_in:
+                        for timestamp, offset, message_length in INDEX_ENTRY.iter_unpack(idx_in.read(length * INDEX_ENTRY.size)):
+                            if message_length == DELETED:
+                                idx_out.write(INDEX_ENTRY.pack(timestamp, log_out.tell(), DELETED))
+                                continue
+                            log_in.seek(offset)
+                            idx_out.write(INDEX_ENTRY.pack(timestamp, log_out.tell(), message_length))
+                            log_out.write(log_in.read(message_length) + b'\n')
+                log_out.flush()
+                os.fsync(log_out.fileno())
+                idx_out.flush()
+                os.fsync(idx_out.fileno())
+        except FileNotFoundError:
+            # The wall was deleted under us
+            copied = False
+
+        with self.lock(fcntl.LOCK_EX):
+            # Deleting the wall removes every file in the shard, the copy included. If that happened while
+            # we were copying, the copy must not bring the old messages back
+            if not (copied and os.path.exists(merged_log) and os.path.exists(merged_idx + '.partial')):
+                for path in [merged_log, merged_idx + '.partial']:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                return 0
+
+            # Messages deleted while we were copying are marked deleted in the merged index too. Only the
+            # indexes are read again, which is far quicker than the copy
+            with open(merged_idx + '.partial', 'r+b') as idx_out:
+                position = 0
+                for segment_base, segment_generation, length in run:
+                    with open(self.segment_path(segment_base, segment_generation, 'idx'), 'rb') as idx_in:
+                        for i, (_, _, message_length) in enumerate(INDEX_ENTRY.iter_unpack(idx_in.read(length * INDEX_ENTRY.size))):
+                            if message_length == DELETED:
+                                idx_out.seek((position + i) * INDEX_ENTRY.size)
+                                timestamp, offset, _ = INDEX_ENTRY.unpack(idx_out.read(INDEX_ENTRY.size))
+                                idx_out.seek((position + i) * INDEX_ENTRY.size)
+                                idx_out.write(INDEX_ENTRY.pack(timestamp, offset, DELETED))
+                    position += length
+                idx_out.flush()
+                os.fsync(idx_out.fileno())
+
+            # The merged segment appears atomically when its index is renamed into place. Until the old
+            # segments are removed below, segments() prefers the merged one, so a crash here loses nothing
+            os.replace(merged_idx + '.partial', merged_idx)
+            for segment_base, segment_generation, _ in run:
+                for extension in ['idx', 'log']:
+                    try:
+                        os.remove(self.segment_path(segment_base, segment_generation, extension))
+                    except FileNotFoundError:
+                        pass
+        return old_bytes - os.path.getsize(merged_log)
+
+    def remove_superseded(self, segments):
+        # Clears out anything an interrupted compaction left behind
+        keep = {'shard.lock', 'compact.lock'}
+        for base_seq, generation, _ in segments:
+            keep.add(os.path.basename(self.segment_path(base_seq, generation, 'idx')))
+            keep.add(os.path.basename(self.segment_path(base_seq, generation, 'log')))
+        for name in os.listdir(self.directory):
+            if name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def stat_key(self):
+        # Read without the lock, so a delete or compaction can remove a file between listing and stat-ing it.
+        # Then the listing is stale: try again, and after a few misses wait for the shard lock
+        for _ in range(3):
+            try:
+                return self.read_stat_key()
+            except FileNotFoundError:
+                pass
+        with self.lock(fcntl.LOCK_SH):
+            return self.read_stat_key()
+
+    def read_stat_key(self):
+        segments = self.segments()
+        if not segments:
+            return None
+        base_seq, generation, _ = segments[-1]
+        stat = os.stat(self.segment_path(base_seq, generation, 'idx'))
+        return (self.number, segments[0][0], base_seq, generation, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+_shards = {}
+
+
+def shard(number):
+    # Shard objects live for the life of the container so their tail caches stay warm
+    if number not in _shards:
+        _shards[number] = Shard(number)
+    return _shards[number]
+
+
+def list_shards():
     try:
-        with open(MSG_FILE_PATH, 'r') as msg_file:
-            fcntl.flock(msg_file, fcntl.LOCK_SH)
-            messages = msg_file.read()
-            fcntl.flock(msg_file, fcntl.LOCK_UN)
-    except:
-        messages = 'No message yet.'
-    return messages
+        names = os.listdir(WALL_DIR)
+    except FileNotFoundError:
+        return []
+    return [shard(int(name[6:])) for name in sorted(names) if name.startswith('shard-')]
+
+
+def get_messages(limit=DEFAULT_PAGE_SIZE, before=None, after=None):
+    """
+    Returns (previous_cursor, next_cursor, messages) for a page of at most `limit` messages merged
+    across every shard. By default that is the newest messages, `before` pages back from a cursor
+    and `after` returns only messages posted since one. A cursor holds a position in every shard.
+    """
+    anchor = before if before is not None else after
+    candidates = []
+    positions = {}
+    for wall_shard in list_shards():
+        position = cursor_position(anchor, wall_shard.number)
+        total, messages = wall_shard.page(limit,
+                                          before=position if before is not None else None,
+                                          after=position if after is not None else None)
+        positions[wall_shard.number] = total if anchor is None else min(total, position)
+        candidates.extend(messages)
+
+    # Each shard is already in timestamp order, so merging just picks the newest (or oldest) overall
+    if after is not None:
+        messages = heapq.nsmallest(limit, candidates)
+    else:
+        messages = sorted(heapq.nlargest(limit, candidates))
+
+    previous_cursor = dict(positions)
+    next_cursor = dict(positions)
+    for _, number, seq, _ in messages:
+        previous_cursor[number] = min(previous_cursor[number], seq)
+        next_cursor[number] = max(next_cursor[number], seq + 1)
+    return previous_cursor, next_cursor, [message for _, _, _, message in messages if message is not None]
 
 
 def add_message(new_message):
-    with open(MSG_FILE_PATH, 'a') as msg_file:
-        fcntl.flock(msg_file, fcntl.LOCK_EX)
-        msg_file.write(new_message + "\n")
-        fcntl.flock(msg_file, fcntl.LOCK_UN)
+    return f'{WRITER_SHARD}:{shard(WRITER_SHARD).append(new_message, FSYNC_WRITES)}'
+
+
+def add_messages(new_messages, sync=FSYNC_WRITES):
+    return [f'{WRITER_SHARD}:{seq}' for seq in shard(WRITER_SHARD).append_many(new_messages, sync)]
+
+
+def delete_message(message_id):
+    number, seq = (int(part) for part in message_id.split(':'))
+    wall_shard = shard(number)
+    return os.path.isdir(wall_shard.directory) and wall_shard.delete_message(seq)
 
 
 def delete_messages():
+    for wall_shard in list_shards():
+        wall_shard.delete()
     try:
-        os.remove(MSG_FILE_PATH)
-    except:
+        os.remove(LEGACY_PATH)
+    except FileNotFoundError:
         pass
 
 
+_legacy_imported = False
+
+
+def import_legacy_messages():
+    """
+    Moves the messages of a wall written before the log existed into shard 0. It holds the old
+    file's lock (the one the old code wrote under) while it does so, so any container that finds
+    the file waits for the import to finish before it reads or writes the wall, and the imported
+    messages stay older than anything posted afterwards. Once a container has seen the file gone
+    it stops looking.
+    """
+    global _legacy_imported
+    if _legacy_imported:
+        return 0
+    try:
+        legacy_file = open(LEGACY_PATH, 'r', newline='')
+    except FileNotFoundError:
+        _legacy_imported = True
+        return 0
+
+    imported = 0
+    with legacy_file:
+        fcntl.flock(legacy_file, fcntl.LOCK_EX)
+        # Another container may have imported and removed it while we waited for the lock
+        if os.path.exists(LEGACY_PATH) and os.fstat(legacy_file.fileno()).st_nlink:
+            # The old wall separated messages with '\n' only, splitlines() would also break them on \r, \x85, \u2028...
+            messages = legacy_file.read().split('\n')
+            if messages[-1] == '':
+                messages.pop()
+            for start in range(0, len(messages), MAX_BATCH_MESSAGES):
+                imported += len(shard(0).append_many(messages[start:start + MAX_BATCH_MESSAGES], sync=True))
+            os.remove(LEGACY_PATH)
+        fcntl.flock(legacy_file, fcntl.LOCK_UN)
+    _legacy_imported = True
+    return imported
+
+
+def compact_wall():
+    return [wall_shard.compact() for wall_shard in list_shards()]
+
+
+def wall_etag(limit=DEFAULT_PAGE_SIZE, before=None, after=None):
+    # Built purely from directory metadata so an unchanged wall can be answered without opening a file.
+    # A shard's newest index grows on every write, is touched by every delete and is recreated by clearing the wall.
+    # The page asked for is part of it too, a new cursor or limit is a different page of the same wall
+    keys = [key for key in (wall_shard.stat_key() for wall_shard in list_shards()) if key is not None]
+    return '"' + hashlib.sha1(repr((limit, before, after, keys)).encode('utf-8')).hexdigest() + '"'
+
+
+def cursor_position(cursor, number):
+    if cursor is None or number >= len(cursor):
+        return 0
+    return cursor[number]
+
+
+def encode_cursor(cursor):
+    if not cursor:
+        return '0'
+    return '.'.join(str(cursor.get(number, 0)) for number in range(max(cursor) + 1))
+
+
+def decode_cursor(value):
+    return [int(position) for position in value.split('.')]
+
+
+def page_params(event):
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = min(MAX_PAGE_SIZE, max(1, int(params.get('limit', DEFAULT_PAGE_SIZE))))
+        before = decode_cursor(params['before']) if 'before' in params else None
+        after = decode_cursor(params['after']) if 'after' in params else None
+    except ValueError:
+        limit, before, after = DEFAULT_PAGE_SIZE, None, None
+    return limit, before, after
+
+
+def wall_response(previous_cursor, next_cursor, messages, paging=False, etag=None):
+    if messages:
+        response = text_response(''.join(message + '\n' for message in messages))
+    elif paging:
+        response = text_response('')
+    else:
+        response = text_response('No message yet.')
+    # Pass these back as ?before= to page further back through the wall, or as ?after= to poll for new messages.
+    # A page can come back empty but still move the cursors when every message in it was deleted
+    if previous_cursor:
+        response['headers']['X-Previous-Cursor'] = encode_cursor(previous_cursor)
+        response['headers']['X-Next-Cursor'] = encode_cursor(next_cursor)
+    if etag:
+        response['headers']['ETag'] = etag
+    return response
+
+
+def batch_messages(event):
+    # A batch is either a JSON list of messages or {"messages": [...]}
+    try:
+        body = json.loads(event.get('body') or '')
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        body = body.get('messages')
+    if not isinstance(body, list) or not body or len(body) > MAX_BATCH_MESSAGES:
+        return None
+    if not all(isinstance(message, str) for message in body):
+        return None
+    return body
+
+
+def json_response(body, status_code=200):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body)
+    }
+
+
+def text_response(body, status_code=200):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'text/plain; charset=utf-8'},
+        'body': body
+    }
+
+
 def lambda_handler(event, context):
+    import_legacy_messages()
     method = event['requestContext']['http']['method']
     if method == 'GET':
-        messages = get_messages()
+        limit, before, after = page_params(event)
+        etag = wall_etag(limit, before, after)
+        if (event.get('headers') or {}).get('if-none-match') == etag:
+            return {'statusCode': 304, 'headers': {'ETag': etag}}
+        return wall_response(*get_messages(limit, before, after),
+                             paging=before is not None or after is not None, etag=etag)
+    elif method == 'POST' and event.get('rawPath', '').rstrip('/').endswith('/batch'):
+        new_messages = batch_messages(event)
+        if new_messages is None:
+            return text_response(f'Send a JSON list of 1 to {MAX_BATCH_MESSAGES} messages.', 400)
+        params = event.get('queryStringParameters') or {}
+        sync = FSYNC_WRITES or params.get('fsync', '').lower() == 'true'
+        # Only the new ids come back, re-reading the wall after every batch would undo the saving
+        return json_response({'ids': add_messages(new_messages, sync)})
     elif method == 'POST':
         new_message = event['body']
-        add_message(new_message)
-        messages = get_messages()
+        message_id = add_message(new_message)
+        response = wall_response(*get_messages())
+        response['headers']['X-Message-Id'] = message_id
+        return response
     elif method == 'DELETE':
-        delete_messages()
-        messages = 'Messages deleted.'
+        params = event.get('queryStringParameters') or {}
+        if 'id' not in params:
+            delete_messages()
+            return text_response('Messages deleted.')
+        try:
+            deleted = delete_message(params['id'])
+        except ValueError:
+            deleted = False
+        return text_response('Message deleted.') if deleted else text_response('No such message.', 404)
     else:
-        messages = 'Method unsupported.'
-    return messages
\ No newline at end of file
+        return text_response('Method unsupported.')
+
+
+def compaction_handler(event, context):
+    # Run on a schedule to merge sealed segments and reclaim the space taken by deleted messages
+    results = compact_wall()
+    print(json.dumps(results))
+    return results
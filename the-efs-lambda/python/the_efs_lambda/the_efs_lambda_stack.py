@@ -4,6 +4,8 @@ from aws_cdk import (
     aws_apigatewayv2_integrations as integrations,
     aws_ec2 as ec2,
     aws_efs as efs,
+    aws_events as events,
+    aws_events_targets as targets,
     core
 )
 
@@ -33,6 +35,20 @@ class TheEfsLambdaStack(core.Stack):
                                       vpc=vpc,
                                       filesystem=_lambda.FileSystem.from_efs_access_point(access_point, '/mnt/msg'))
 
+        # Merges sealed log segments and reclaims the space of deleted messages, on the same file system
+        compaction_lambda = _lambda.Function(self, 'compactionHandler',
+                                             runtime=_lambda.Runtime.PYTHON_3_8,
+                                             code=_lambda.Code.asset('lambda_fns'),
+                                             handler='message_wall.compaction_handler',
+                                             timeout=core.Duration.minutes(5),
+                                             vpc=vpc,
+                                             filesystem=_lambda.FileSystem.from_efs_access_point(access_point, '/mnt/msg'))
+
+        # Run compaction every hour
+        compaction_schedule = events.Rule(self, 'compaction-schedule',
+                                          schedule=events.Schedule.rate(core.Duration.hours(1)))
+        compaction_schedule.add_target(targets.LambdaFunction(compaction_lambda))
+
         # defines an API Gateway Http API resource backed by our "efs_lambda" function.
         api = api_gw.HttpApi(self, 'EFS Lambda',
                              default_integration=integrations.LambdaProxyIntegration(handler=efs_lambda));
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the extraction task in container/s3DataExtractionTask/main.py
+
+Generates synthetic address files (csv, tsv, optionally gzipped) of each size, serves them from a
+local stand-in for S3 and captures PutEvents (or BatchWriteItem) calls with a fake that takes
+--latency-ms per call, then runs extract() in a fresh process for every combination of file, extraction
+mode and load mode. Reports rows/s, publish calls, peak RSS and wall time, so any change to the
+extractor can be measured without deploying Fargate.
+
+    python benchmarks/etl_benchmark.py --rows 10000 1000000 --formats csv tsv --modes stream download --latency-ms 20
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+EXTRACTION_TASK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container', 's3DataExtractionTask')
+
+HEADERS = ['ID', 'HouseNum', 'Street', 'Town', 'Zip']
+STREETS = ['Main Street', '2nd Street', 'Church Road', 'Mill Lane', 'Station Road', 'High Street']
+TOWNS = ['Antrim', 'Glengormley', 'Belfast', 'Lisburn', 'Newry', 'Bangor']
+
+
+def generate(directory, rows, file_format):
+    # The same seed every time, so results from different runs of the benchmark line up
+    delimiter = '\t' if file_format.startswith('tsv') else ','
+    key = f'addresses-{rows}.{file_format}'
+    path = os.path.join(directory, key)
+    generator = random.Random(rows)
+    opener = gzip.open if file_format.endswith('.gz') else open
+    with opener(path, 'wt') as data_file:
+        data_file.write(delimiter.join(HEADERS) + '\n')
+        for row in range(1, rows + 1):
+            data_file.write(delimiter.join([str(row), str(generator.randint(1, 200)), generator.choice(STREETS),
+                                            generator.choice(TOWNS), str(generator.randint(10000, 99999))]) + '\n')
+    return key, path
+
+
+class FileBody:
+    """A get_object Body reading `length` bytes of a local file from `start`"""
+
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class LocalS3:
+    """The get_object (with Range), head_object and download_file calls the extractor makes, over local files"""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.gets = 0
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': os.path.getsize(self.paths[Key]), 'ETag': '"' + Key + '"'}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.gets += 1
+        path = self.paths[Key]
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        if Range:
+            first, last = Range[len('bytes='):].split('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        length = max(0, end - start + 1)
+        return {'Body': FileBody(path, start, length), 'ContentLength': length, 'ETag': '"' + Key + '"'}
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self.paths[Key], Filename)
+
+
+class FakeEvents:
+    """Counts PutEvents calls and entries, each call taking `latency` seconds like a round trip to EventBridge"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.entries = 0
+
+    def put_events(self, Entries):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            self.entries += len(Entries)
+        return {'FailedEntryCount': 0, 'Entries': [{'EventId': str(i)} for i in range(len(Entries))]}
+
+
+class FakeDynamoDB:
+    """Counts BatchWriteItem calls and items for the direct load mode, with the same latency"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.items = 0
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            self.items += sum(len(requests) for requests in RequestItems.values())
+        return {'UnprocessedItems': {}}
+
+
+def worker(key, path, mode, load_mode, args, results):
+    # Settings the extractor reads at import time
+    os.environ['LOG_LEVEL'] = 'DEBUG' if args.verbose else 'WARNING'
+    os.environ['PUBLISH_RATE'] = str(args.publish_rate)
+    sys.path.insert(0, EXTRACTION_TASK)
+    import main
+
+    s3 = LocalS3({key: path})
+    events = FakeEvents(args.latency_ms / 1000)
+    dynamodb = FakeDynamoDB(args.latency_ms / 1000)
+    started = time.perf_counter()
+    stats = main.extract(s3, events, 'benchmark', key, mode=mode, workers=args.workers, pack=args.pack,
+                         dynamodb=dynamodb, load_mode=load_mode, table_name='benchmark')
+    elapsed = time.perf_counter() - started
+
+    results.put({
+        'key': key,
+        'mode': mode,
+        'load_mode': load_mode,
+        'rows': stats['rows_read'],
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(stats['rows_read'] / elapsed, 1),
+        'publish_calls': events.calls if load_mode == 'events' else dynamodb.calls,
+        'published': stats['published'],
+        'failed': stats['failed'],
+        'get_calls': s3.gets,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    })
+
+
+def run(key, path, mode, load_mode, args):
+    # A fresh process for every run, so peak RSS is the extraction's alone
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=worker, args=(key, path, mode, load_mode, args, results))
+    process.start()
+    # A run that dies (say on import) never puts a result, so don't wait on the queue forever
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                process.join()
+                # It may have put its result and exited while we were waiting
+                try:
+                    result = results.get_nowait()
+                    break
+                except queue.Empty:
+                    raise RuntimeError(f'{key} {mode}/{load_mode} exited with code {process.exitcode} without a result')
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput benchmark of the EventBridge ETL extraction task')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help='rows in each generated file')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'tsv'], choices=['csv', 'tsv', 'csv.gz', 'tsv.gz'])
+    parser.add_argument('--modes', nargs='+', default=['stream', 'download'], choices=['stream', 'download'],
+                        help='extraction modes')
+    parser.add_argument('--load-modes', nargs='+', default=['events'], choices=['events', 'direct'])
+    parser.add_argument('--workers', type=int, default=8, help='publisher threads')
+    parser.add_argument('--pack', action='store_true', help='pack blocks of rows into each event')
+    parser.add_argument('--latency-ms', type=float, default=20, help='time each fake PutEvents/BatchWriteItem call takes')
+    parser.add_argument('--publish-rate', type=float, default=0, help='PUBLISH_RATE for the adaptive rate limiter, 0 is off')
+    parser.add_argument('--verbose', action='store_true', help='let the extractor log (and sample rows) while it runs')
+    parser.add_argument('--json', action='store_true', help='print one JSON result per line instead of a table')
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'file':>28} {'mode':>9} {'load':>7} {'rows':>9} {'seconds':>9} {'rows/s':>10} "
+              f"{'calls':>8} {'failed':>7} {'GETs':>5} {'RSS MB':>7}")
+
+    directory = tempfile.mkdtemp(prefix='etl-benchmark-')
+    try:
+        for rows in args.rows:
+            for file_format in args.formats:
+                key, path = generate(directory, rows, file_format)
+                for mode in args.modes:
+                    for load_mode in args.load_modes:
+                        try:
+                            result = run(key, path, mode, load_mode, args)
+                        except RuntimeError as error:
+                            print(f'{error}, see its traceback above', file=sys.stderr)
+                            sys.exit(1)
+                        if args.json:
+                            print(json.dumps(result))
+                        else:
+                            print(f"{result['key']:>28} {result['mode']:>9} {result['load_mode']:>7} {result['rows']:>9} "
+                                  f"{result['seconds']:>9.2f} {result['rows_per_second']:>10.1f} {result['publish_calls']:>8} "
+                                  f"{result['failed']:>7} {result['get_calls']:>5} {result['peak_rss_mb']:>7.1f}")
+                os.remove(path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
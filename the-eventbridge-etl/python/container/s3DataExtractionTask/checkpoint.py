@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+# Checkpoints of finished extractions are kept for a week so a re-delivered S3 notification is a no-op
+CHECKPOINT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def checkpoint_id(bucket_name, object_key, etag, part=None):
+    # The ETag is part of the id, so overwriting the object starts a fresh extraction
+    checkpoint = bucket_name + '/' + object_key + '#' + etag.strip('"')
+    if part is not None:
+        checkpoint += '@' + str(part[2]) + '-' + str(part[3])
+    return checkpoint
+
+
+class DynamoCheckpointStore:
+    """
+    Checkpoints kept as items in a DynamoDB table with an `id` partition key. A table rather than an
+    S3 object so writing checkpoints can't trigger the landing bucket's notifications.
+    """
+
+    def __init__(self, dynamodb, table_name):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+
+    def get(self, checkpoint):
+        item = self.dynamodb.get_item(TableName=self.table_name, Key={'id': {'S': checkpoint}},
+                                      ConsistentRead=True).get('Item')
+        if item is None:
+            return None
+        return {
+            'offset': int(item['offset']['N']),
+            'rows': int(item['rows']['N']),
+            'done': item['done']['BOOL']
+        }
+
+    def put(self, checkpoint, offset, rows, done=False):
+        self.dynamodb.put_item(TableName=self.table_name, Item={
+            'id': {'S': checkpoint},
+            'offset': {'N': str(offset)},
+            'rows': {'N': str(rows)},
+            'done': {'BOOL': done},
+            'expires': {'N': str(int(time.time()) + CHECKPOINT_TTL_SECONDS)}
+        })
+
+
+class FileCheckpointStore:
+    """Checkpoints kept as json files in a local directory, for running the extraction locally"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, checkpoint):
+        return os.path.join(self.directory, checkpoint.replace('/', '_') + '.json')
+
+    def get(self, checkpoint):
+        try:
+            with open(self.path(checkpoint)) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, checkpoint, offset, rows, done=False):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(checkpoint)
+        with open(path + '.partial', 'w') as checkpoint_file:
+            json.dump({'offset': offset, 'rows': rows, 'done': done}, checkpoint_file)
+        os.replace(path + '.partial', path)
+
+
+class Watermark:
+    """
+    The furthest point in the object that it is safe to resume from. Every batch the publisher
+    sends is issued a sequence number along with the (offset, rows) just past its last row, and
+    batches can be acknowledged in any order, but the watermark only moves past a batch once it
+    and every batch before it went out. A batch that failed is never acknowledged, so it holds the
+    watermark back and a restart sends it again. An entry that can never be sent is acknowledged
+    without going out, since a restart would only fail on it again.
+    """
+
+    def __init__(self, offset=0, rows=0):
+        self.offset = offset
+        self.rows = rows
+        self.lock = threading.Lock()
+        self.issued = 0
+        self.next_seq = 0
+        self.acknowledged = {}
+
+    def issue(self):
+        with self.lock:
+            seq = self.issued
+            self.issued += 1
+            return seq
+
+    def acknowledge(self, seq, mark):
+        with self.lock:
+            self.acknowledged[seq] = mark
+            while self.next_seq in self.acknowledged:
+                mark = self.acknowledged.pop(self.next_seq)
+                if mark is not None:
+                    self.offset, self.rows = mark
+                self.next_seq += 1
+
+    def position(self):
+        with self.lock:
+            return self.offset, self.rows
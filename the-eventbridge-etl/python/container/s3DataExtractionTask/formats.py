@@ -0,0 +1,220 @@
+import gzip
+
+# Both are optional, only needed for zstd compressed or parquet objects
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+PARQUET_MAGIC = b'PAR1'
+MAGIC_BYTES = 4
+
+# Rows are read from a parquet row group this many at a time
+PARQUET_BATCH_ROWS = 10000
+
+
+class InputFormat:
+
+    def __init__(self, kind, compression, delimiter):
+        self.kind = kind
+        self.compression = compression
+        self.delimiter = delimiter
+
+    @property
+    def splittable(self):
+        # Only plain text can be read from an arbitrary byte offset
+        return self.kind == 'text' and self.compression is None
+
+    def __repr__(self):
+        return self.kind + '/' + (self.compression or 'uncompressed') + '/' + repr(self.delimiter)
+
+
+def detect_format(object_key, magic=b'', delimiter=None):
+    """
+    Works out how to read an object from its key's extensions (data.tsv.gz, data.parquet, ...),
+    falling back to its first few bytes for anything the extensions don't say. The delimiter is
+    a tab for .tsv/.tab files and a comma otherwise, unless one is given.
+    """
+    extensions = object_key.lower().split('/')[-1].split('.')[1:]
+
+    compression = None
+    if extensions and extensions[-1] in ('gz', 'gzip'):
+        compression = 'gzip'
+        extensions.pop()
+    elif extensions and extensions[-1] in ('zst', 'zstd'):
+        compression = 'zstd'
+        extensions.pop()
+    elif magic.startswith(GZIP_MAGIC):
+        compression = 'gzip'
+    elif magic.startswith(ZSTD_MAGIC):
+        compression = 'zstd'
+
+    if (extensions and extensions[-1] in ('parquet', 'pq')) or (compression is None and magic.startswith(PARQUET_MAGIC)):
+        return InputFormat('parquet', None, None)
+
+    if delimiter is None:
+        delimiter = '\t' if extensions and extensions[-1] in ('tsv', 'tab') else ','
+    return InputFormat('text', compression, delimiter)
+
+
+class PrefixedStream:
+    """A stream that gives back `prefix` before carrying on with the rest of `stream`"""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def close(self):
+        self.stream.close()
+
+
+def peek(stream, size=MAGIC_BYTES):
+    # Reads the first bytes of a stream (to look for magic numbers) without losing them
+    magic = stream.read(size)
+    return PrefixedStream(magic, stream), magic
+
+
+class DecompressedStream:
+    """Reading gives the decompressed bytes of `stream`, a chunk at a time, closing closes both"""
+
+    def __init__(self, reader, stream):
+        self.reader = reader
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.reader.read(size)
+
+    def close(self):
+        self.reader.close()
+        self.stream.close()
+
+
+def decompress(stream, compression):
+    if compression is None:
+        return stream
+    if compression == 'gzip':
+        return DecompressedStream(gzip.GzipFile(fileobj=stream, mode='rb'), stream)
+    if zstandard is None:
+        raise RuntimeError('The zstandard package is needed to read zstd compressed objects')
+    return DecompressedStream(zstandard.ZstdDecompressor().stream_reader(stream), stream)
+
+
+class S3File:
+    """
+    A read only, seekable file over an S3 object that fetches what is read with ranged GETs,
+    reading ahead in blocks of `block_bytes`. Parquet readers jump between the footer and the
+    row groups, so this lets them work without downloading the whole object.
+    """
+
+    def __init__(self, s3, bucket_name, object_key, block_bytes=8 * 1024 * 1024):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.block_bytes = block_bytes
+        self.size = s3.head_object(Bucket=bucket_name, Key=object_key)['ContentLength']
+        self.position = 0
+        self.buffer = b''
+        self.buffer_start = 0
+        self.closed = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b''
+        end = self.position + size
+        buffer_end = self.buffer_start + len(self.buffer)
+        if self.position < self.buffer_start or end > buffer_end:
+            # Fetch at least a whole block so lots of small reads don't each cost a GET
+            fetch_end = min(self.size, max(end, self.position + self.block_bytes))
+            self.buffer = self.s3.get_object(Bucket=self.bucket_name, Key=self.object_key,
+                                             Range='bytes=' + str(self.position) + '-' + str(fetch_end - 1))['Body'].read()
+            self.buffer_start = self.position
+        data = self.buffer[self.position - self.buffer_start:end - self.buffer_start]
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+        self.buffer = b''
+
+
+class ParquetRows:
+    """
+    Iterates a parquet file one row group at a time (in batches of PARQUET_BATCH_ROWS), giving
+    each row as a list of strings like a csv reader would, so memory is bounded by the batch
+    rather than the file. There are no byte offsets to checkpoint in a parquet file, so `offset`
+    counts rows instead, and `skip` resumes after that many rows, skipping whole row groups where
+    it can.
+    """
+
+    def __init__(self, source, skip=0):
+        if parquet is None:
+            raise RuntimeError('The pyarrow package is needed to read parquet objects')
+        self.source = source
+        self.file = parquet.ParquetFile(source)
+        self.headers = self.file.schema_arrow.names
+        self.offset = skip
+        self.end = None
+        self.rows = self.iterate(skip)
+
+    def iterate(self, skip):
+        metadata = self.file.metadata
+        for row_group in range(metadata.num_row_groups):
+            group_rows = metadata.row_group(row_group).num_rows
+            if skip >= group_rows:
+                skip -= group_rows
+                continue
+            for batch in self.file.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=[row_group]):
+                columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+                for row in zip(*columns):
+                    if skip:
+                        skip -= 1
+                        continue
+                    self.offset += 1
+                    yield ['' if value is None else str(value) for value in row]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.rows)
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+# INFO logs what the task is doing and its progress, DEBUG adds (a sample of) the rows themselves
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Fraction of rows logged in debug mode, logging every row of a big file costs more than reading it
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, so CloudWatch Logs Insights can filter and aggregate on the fields.
+    Anything passed as extra={'fields': {...}} is merged into the record.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['error'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class Sampler:
+    """Decides which of a stream of records to keep, each with probability `rate`"""
+
+    def __init__(self, rate=LOG_SAMPLE_RATE, random=random.random):
+        self.rate = rate
+        self.random = random
+
+    def __call__(self):
+        return self.rate >= 1 or (self.rate > 0 and self.random() < self.rate)
+
+
+def get_logger(name='etl', level=LOG_LEVEL, stream=sys.stdout):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+    return logger
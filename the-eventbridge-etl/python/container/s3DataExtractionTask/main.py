@@ -1,56 +1,415 @@
 import boto3
-import time
 import os
 import csv
+import time
 from datetime import datetime
 import json
+import logging
+
+from checkpoint import DynamoCheckpointStore, FileCheckpointStore, Watermark, checkpoint_id
+from formats import ParquetRows, S3File, decompress, detect_format, peek
+from logger import Sampler, get_logger
+from publisher import EventPublisher
+from rate_limiter import AdaptiveRateLimiter
+from table_writer import TableWriter
+from s3_source import DOWNLOAD_PATH, LineStream, open_object, open_range
+
+log = get_logger()
+
+# 'stream' parses the object as it is read from S3, 'download' copies it to /tmp first
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'stream')
+
+# The column delimiter for csv/tsv input, by default a tab for .tsv files and a comma for anything else
+DELIMITER = {'tab': '\t', '\\t': '\t'}.get(os.environ.get('DELIMITER'), os.environ.get('DELIMITER')) or None
+
+# How many times a PutEvents entry is tried before it is counted as failed
+PUBLISH_ATTEMPTS = int(os.environ.get('PUBLISH_ATTEMPTS', '5'))
+
+# Threads sending PutEvents batches in parallel, and how many full batches can wait for them
+# before the reader is made to wait
+PUBLISHER_WORKERS = int(os.environ.get('PUBLISHER_WORKERS', '8'))
+PUBLISH_QUEUE_BATCHES = int(os.environ.get('PUBLISH_QUEUE_BATCHES', str(PUBLISHER_WORKERS * 4)))
+
+# PutEvents entries per second, starting at PUBLISH_RATE and adapting between the min and max:
+# raised a step every second without throttling, halved when EventBridge throttles us.
+# PUBLISH_RATE=0 turns rate control off
+PUBLISH_RATE = float(os.environ.get('PUBLISH_RATE', '1000'))
+PUBLISH_RATE_MIN = float(os.environ.get('PUBLISH_RATE_MIN', '10'))
+PUBLISH_RATE_MAX = float(os.environ.get('PUBLISH_RATE_MAX', '10000'))
+PUBLISH_RATE_STEP = float(os.environ.get('PUBLISH_RATE_STEP', '100'))
+
+# 'events' puts rows onto EventBridge for the transform and load lambdas. 'direct' transforms
+# rows into items here and writes them straight into TABLE_NAME with BatchWriteItem, only putting
+# a summary event per file onto EventBridge, for bulk backfills
+LOAD_MODE = os.environ.get('LOAD_MODE', 'events')
+TABLE_NAME = os.environ.get('TABLE_NAME')
+
+# Which column ends up in which attribute, the same mapping the load lambda uses
+ITEM_ATTRIBUTES = [('id', 'ID'), ('house_number', 'HouseNum'), ('street_address', 'Street'), ('town', 'Town'),
+                   ('zip', 'Zip')]
+
+# Log the publisher's rate, retries and backlog as a metric line this often
+METRICS_SECONDS = float(os.environ.get('METRICS_SECONDS', '10'))
+
+# Opt in to putting a block of rows (with the headers once) in each event instead of one row per event.
+# Blocks are capped by row count and by the size of their detail, well under the 256KB PutEvents limit
+PACK_ROWS = os.environ.get('PACK_ROWS', 'false').lower() == 'true'
+PACK_MAX_ROWS = int(os.environ.get('PACK_MAX_ROWS', '500'))
+PACK_MAX_BYTES = int(os.environ.get('PACK_MAX_BYTES', str(200 * 1024)))
+
+# Log progress at most this often
+PROGRESS_SECONDS = float(os.environ.get('PROGRESS_SECONDS', '30'))
+
+# Where to keep checkpoints so a restarted task carries on where the last one got to: a DynamoDB
+# table (CHECKPOINT_TABLE) or, when running locally, a directory (CHECKPOINT_DIR). With neither
+# there are no checkpoints
+CHECKPOINT_TABLE = os.environ.get('CHECKPOINT_TABLE')
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR')
+CHECKPOINT_SECONDS = float(os.environ.get('CHECKPOINT_SECONDS', '10'))
+
+
+def byte_range():
+    """
+    The part of the object this task extracts, when the extract lambda split it into ranges:
+    (index, count, start, end) or None for the whole object.
+    """
+    if not os.environ.get('S3_RANGE_START'):
+        return None
+    return (int(os.environ.get('S3_RANGE_INDEX', '0')), int(os.environ.get('S3_RANGE_COUNT', '1')),
+            int(os.environ['S3_RANGE_START']), int(os.environ['S3_RANGE_END']))
+
+
+def open_rows(s3, bucket_name, object_key, mode, part, resume_offset=0):
+    """
+    Returns (body, lines, headers, reader) for the object, in whatever format detect_format()
+    finds. `lines` tracks where the reader is in the object: a byte offset for csv/tsv, a row
+    number for parquet.
+
+    Plain csv/tsv can be split into ranges. A range owns every line that starts inside it, so the
+    headers are read separately from the start of the object, the reader starts one byte before
+    the range to drop the tail of the line the previous range owns, and stops at the first line
+    starting past the end of the range. Ranges are split on newlines, so they assume quoted
+    fields don't contain any. Resuming from a checkpoint works the same way, starting from the
+    end of the last row that was published. Compressed and parquet objects can't be read from an
+    arbitrary offset, so the first range reads all of it and resuming skips what was done.
+    """
+    ranged = part is not None or resume_offset
+    if ranged:
+        body = open_range(s3, bucket_name, object_key, 0)
+    else:
+        body = open_object(s3, bucket_name, object_key, mode)
+    body, magic = peek(body)
+    input_format = detect_format(object_key, magic, DELIMITER)
+    log.info('Input format ' + repr(input_format), extra={'fields': {'format': input_format.kind, 'compression': input_format.compression}})
+
+    if part is not None and not input_format.splittable and part[0] > 0:
+        log.info('Range ' + str(part[0]) + ' skipped, the first range reads the whole object')
+        body.close()
+        return body, LineStream(body, offset=0, end=0), None, iter([])
+
+    if input_format.kind == 'parquet':
+        # Parquet needs to seek, a downloaded file can, an S3 object is read with ranged GETs
+        body.close()
+        source = open(DOWNLOAD_PATH, 'rb') if mode == 'download' and not ranged else S3File(s3, bucket_name, object_key)
+        rows = ParquetRows(source, skip=resume_offset)
+        return rows, rows, rows.headers, rows
+
+    if not input_format.splittable or not ranged:
+        stream = decompress(body, input_format.compression)
+        lines = LineStream(stream, encoding='utf-8-sig')
+        reader = csv.reader(lines, delimiter=input_format.delimiter)
+        headers = next(reader, None)
+        if resume_offset:
+            lines.skip_to(resume_offset)
+        return stream, lines, headers, reader
+
+    start, end = (part[2], part[3]) if part is not None else (0, None)
+    try:
+        header_lines = LineStream(body, encoding='utf-8-sig')
+        headers = next(csv.reader(header_lines, delimiter=input_format.delimiter), None)
+    finally:
+        body.close()
+
+    if headers is None:
+        return body, header_lines, None, iter([])
+
+    start = max(start, header_lines.offset, resume_offset)
+    body = open_range(s3, bucket_name, object_key, start - 1)
+    lines = LineStream(body, offset=start - 1, end=end)
+    if end is None or start < end:
+        lines.next_line()
+    else:
+        lines.end = lines.offset
+    return body, lines, headers, csv.reader(lines, delimiter=input_format.delimiter)
+
+
+def logged_rows(reader, lines, sampler=None):
+    """
+    Rows are only logged in debug mode, and then only a sample of them (LOG_SAMPLE_RATE). Otherwise
+    the reader is handed back as it is, so logging costs nothing per row.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return reader
+    sampler = sampler or Sampler()
+    return (log_row(row, lines, sampler) for row in reader)
+
+
+def log_row(row, lines, sampler):
+    if sampler():
+        log.debug('row', extra={'fields': {'row': row, 'offset': lines.offset}})
+    return row
+
+
+def row_events(reader, lines, headers, pack=False, max_rows=PACK_MAX_ROWS, max_bytes=PACK_MAX_BYTES):
+    """
+    Yields (detail, row count, offset) for every event to put onto EventBridge, either one per row
+    or one per block of rows when packing. The offset is the byte position just past the event's
+    last row.
+    """
+    joined_headers = ','.join(headers)
+    if not pack:
+        for row in reader:
+            yield {'status': 'extracted', 'headers': joined_headers, 'data': ','.join(row)}, 1, lines.offset
+        return
+
+    empty_bytes = len(json.dumps({'status': 'extracted', 'headers': joined_headers, 'rows': []}))
+    block = []
+    block_bytes = empty_bytes
+    block_end = lines.offset
+    for row in reader:
+        data = ','.join(row)
+        # json.dumps escapes everything to ascii, so its length is the row's size in the detail
+        size = len(json.dumps(data)) + 2
+        if block and (len(block) == max_rows or block_bytes + size > max_bytes):
+            yield {'status': 'extracted', 'headers': joined_headers, 'rows': block}, len(block), block_end
+            block = []
+            block_bytes = empty_bytes
+        block.append(data)
+        block_bytes += size
+        block_end = lines.offset
+    if block:
+        yield {'status': 'extracted', 'headers': joined_headers, 'rows': block}, len(block), block_end
+
+
+def row_items(reader, lines, headers):
+    """
+    Yields (put request, 1, offset) for every row, doing the transform and load lambdas' work:
+    the row is matched up with the headers and mapped onto the table's attributes.
+    """
+    for row in reader:
+        data = dict(zip(headers, row))
+        item = {name: {'S': data[column]} for name, column in ITEM_ATTRIBUTES if column in data}
+        yield {'PutRequest': {'Item': item}}, 1, lines.offset
+
+
+def event_entry(detail, detail_type='s3RecordExtraction'):
+    return {
+        'DetailType': detail_type,
+        'EventBusName': 'default',
+        'Source': 'cdkpatterns.the-eventbridge-etl',
+        'Time': datetime.now(),
+        'Detail': json.dumps(detail)
+    }
+
+
+def extract(s3, event_bridge, bucket_name, object_key, mode=EXTRACTION_MODE, workers=PUBLISHER_WORKERS, pack=PACK_ROWS,
+            part=None, checkpoints=None, dynamodb=None, load_mode=LOAD_MODE, table_name=TABLE_NAME):
+    """
+    Reads the csv object (or just the `part` from byte_range()) and puts one event per row (or
+    block of rows when packing) onto EventBridge. This thread parses rows and packs them into
+    PutEvents batches while a pool of publisher threads sends them, see EventPublisher. The
+    clients and checkpoint store are passed in so this can be run against stubs locally.
+    Returns the reader's and publisher's stats.
+
+    In the 'direct' load mode rows become items written to `table_name` by a TableWriter
+    instead, which batches and sends them the same way.
+
+    With a checkpoint store the position up to which every row has been published is saved
+    every CHECKPOINT_SECONDS, and an extraction of the same object (and ETag) carries on from
+    there. Rows after the checkpoint that went out before a crash are sent again, so downstream
+    stages see at least once delivery.
+    """
+    started = time.monotonic()
+    checkpoint = None
+    resume = None
+    if checkpoints is not None:
+        etag = s3.head_object(Bucket=bucket_name, Key=object_key)['ETag']
+        checkpoint = checkpoint_id(bucket_name, object_key, etag, part)
+        resume = checkpoints.get(checkpoint)
+        if resume is not None and resume['done']:
+            log.info(checkpoint + ' was already extracted', extra={'fields': {'checkpoint': checkpoint}})
+            return dict(progress(part, 0, 0), skipped=True, failed=0, published=0)
+        if resume is not None:
+            log.info('Resuming ' + checkpoint, extra={'fields': {'checkpoint': checkpoint, 'offset': resume['offset'],
+                                                                'rows': resume['rows']}})
+
+    body, lines, headers, reader = open_rows(s3, bucket_name, object_key, mode, part,
+                                             resume['offset'] if resume is not None else 0)
+    first_byte = lines.offset
+    rows = resume['rows'] if resume is not None else 0
+    first_row = rows
+    watermark = Watermark(first_byte, rows)
+    rate_limiter = AdaptiveRateLimiter(PUBLISH_RATE, PUBLISH_RATE_MIN, PUBLISH_RATE_MAX, PUBLISH_RATE_STEP) \
+        if PUBLISH_RATE > 0 else None
+    options = {'workers': workers, 'queue_batches': PUBLISH_QUEUE_BATCHES, 'max_attempts': PUBLISH_ATTEMPTS,
+               'watermark': watermark, 'rate_limiter': rate_limiter, 'metrics_seconds': METRICS_SECONDS}
+    if load_mode == 'direct':
+        publisher = TableWriter(dynamodb, table_name, **options)
+    else:
+        publisher = EventPublisher(event_bridge, **options)
+    reported = started
+    saved = watermark.position()
+    saved_at = started
+    try:
+        if headers is None:
+            records = []
+        elif load_mode == 'direct':
+            records = row_items(logged_rows(reader, lines), lines, headers)
+        else:
+            records = ((event_entry(event), count, offset)
+                       for event, count, offset in row_events(logged_rows(reader, lines), lines, headers, pack))
+        for record, count, offset in records:
+            rows += count
+            publisher.add(record, mark=(offset, rows))
+            now = time.monotonic()
+            if now - reported >= PROGRESS_SECONDS:
+                reported = now
+                log.info('progress', extra={'fields': progress_record(part, rows - first_row, lines.offset - first_byte,
+                                                                      now - started, publisher.stats())})
+            if checkpoint is not None and now - saved_at >= CHECKPOINT_SECONDS and watermark.position() != saved:
+                saved_at = now
+                saved = watermark.position()
+                checkpoints.put(checkpoint, *saved)
+    finally:
+        body.close()
+        try:
+            publisher.close()
+        finally:
+            # Whatever happened, remember how far we got
+            if checkpoint is not None and watermark.position() != saved:
+                checkpoints.put(checkpoint, *watermark.position())
+
+    # Rejected rows would be rejected again, only rows that could still go out on a re-run keep the range open
+    if checkpoint is not None and publisher.failed == publisher.rejected:
+        checkpoints.put(checkpoint, lines.offset, rows, done=True)
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    stats = {
+        'rows_read': rows - first_row,
+        'bytes_read': lines.offset - first_byte,
+        'rows_per_second': round((rows - first_row) / elapsed, 1),
+        'seconds': round(elapsed, 3)
+    }
+    if resume is not None:
+        stats['resumed_from_byte'] = resume['offset']
+        stats['resumed_from_row'] = resume['rows']
+    if part is not None:
+        stats.update(progress(part, rows - first_row, lines.offset - first_byte))
+    stats.update(publisher.stats())
+    return stats
+
+
+def checkpoint_store():
+    if CHECKPOINT_TABLE:
+        return DynamoCheckpointStore(boto3.client('dynamodb'), CHECKPOINT_TABLE)
+    if CHECKPOINT_DIR:
+        return FileCheckpointStore(CHECKPOINT_DIR)
+    return None
+
+
+def progress(part, rows, bytes_read):
+    if part is None:
+        return {'rows_read': rows, 'bytes_read': bytes_read}
+    index, count, start, end = part
+    return {
+        'range_index': index,
+        'range_count': count,
+        'rows_read': rows,
+        'bytes_read': bytes_read,
+        'range_fraction': round(min(1.0, bytes_read / max(1, end - start)), 3)
+    }
+
+
+def progress_record(part, rows, bytes_read, seconds, publisher_stats):
+    # What the periodic progress log line carries: how far the reader is and how the publishing is going
+    record = progress(part, rows, bytes_read)
+    record['rows_per_second'] = round(rows / max(seconds, 1e-9), 1)
+    for name in ('published', 'retried', 'throttled', 'failed', 'queued_batches', 'rate'):
+        if name in publisher_stats:
+            record[name] = publisher_stats[name]
+    return record
+
+
+def report_range(event_bridge, bucket_name, object_key, stats):
+    # Lets the observer keep track of every range of a split object as it finishes
+    event_bridge.put_events(Entries=[event_entry({
+        'status': 'range-extracted',
+        'bucket': bucket_name,
+        'key': object_key,
+        'range_index': stats['range_index'],
+        'range_count': stats['range_count'],
+        'rows': stats['rows_read'],
+        'bytes': stats['bytes_read'],
+        'failed': stats['failed']
+    }, 's3RangeExtracted')])
+
+
+def report_load(event_bridge, bucket_name, object_key, stats):
+    # In the direct load mode this one event per file (or range) is all that goes onto EventBridge
+    detail = {
+        'status': 'loaded',
+        'bucket': bucket_name,
+        'key': object_key,
+        'table': stats['table'],
+        'rows': stats['rows_read'],
+        'bytes': stats['bytes_read'],
+        'written': stats['published'],
+        'failed': stats['failed'],
+        'seconds': stats['seconds']
+    }
+    if 'range_index' in stats:
+        detail['range_index'] = stats['range_index']
+        detail['range_count'] = stats['range_count']
+    event_bridge.put_events(Entries=[event_entry(detail, 's3ObjectLoaded')])
+
 
 def main():
-    event_bridge = boto3.client('events')
     # https://stackoverflow.com/questions/4906977/how-to-access-environment-variable-values
-
     data_s3_bucket_name = os.environ.get('S3_BUCKET_NAME')
-    data_s3_object_key  = os.environ.get('S3_OBJECT_KEY')
+    data_s3_object_key = os.environ.get('S3_OBJECT_KEY')
 
     if (None == data_s3_bucket_name
      or None == data_s3_object_key):
-        print('ERROR: unable to retrieve environment variables (s3 bucket or object key, stream name')
+        log.error('unable to retrieve environment variables (s3 bucket or object key, stream name')
         exit(1)
 
-    print('Bucket Name ' + data_s3_bucket_name)
-    print('S3 Object Key ' + data_s3_object_key)
-
-    local_file = '/tmp/data.tsv'
-
-    s3_resource = boto3.resource('s3')
-    s3_resource.Object(data_s3_bucket_name, data_s3_object_key).download_file(local_file)
-
-    print('SUCCESS: data file downloaded: ' + local_file)
+    if LOAD_MODE == 'direct' and not TABLE_NAME:
+        log.error('the direct load mode needs the TABLE_NAME environment variable')
+        exit(1)
 
+    part = byte_range()
+    log.info('Extracting s3://' + data_s3_bucket_name + '/' + data_s3_object_key, extra={'fields': {
+        'bucket': data_s3_bucket_name,
+        'key': data_s3_object_key,
+        'extraction_mode': EXTRACTION_MODE,
+        'load_mode': LOAD_MODE,
+        'range': None if part is None else {'index': part[0], 'count': part[1], 'start': part[2], 'end': part[3]}
+    }})
 
-    with open(local_file) as csvfile:
-        reader = csv.reader(csvfile, delimiter=',')
-        headers = next(reader)
-        for row in reader:
-            print(', '.join(row))
-            event = {
-                'status': 'extracted',
-                'headers': ','.join(headers),
-                'data': ','.join(row)
-            }
-            response = event_bridge.put_events(
-                Entries=[
-                    {
-                        'DetailType': 's3RecordExtraction',
-                        'EventBusName': 'default',
-                        'Source': 'cdkpatterns.the-eventbridge-etl',
-                        'Time': datetime.now(),
-                        'Detail': json.dumps(event)
-                        
-                    },
-                ]
-            )
+    event_bridge = boto3.client('events')
+    stats = extract(boto3.client('s3'), event_bridge, data_s3_bucket_name, data_s3_object_key, part=part,
+                    checkpoints=checkpoint_store(), dynamodb=boto3.client('dynamodb'))
+    log.info('Extraction stats', extra={'fields': stats})
+    if LOAD_MODE == 'direct' and not stats.get('skipped'):
+        report_load(event_bridge, data_s3_bucket_name, data_s3_object_key, stats)
+    elif part is not None and not stats.get('skipped'):
+        report_range(event_bridge, data_s3_bucket_name, data_s3_object_key, stats)
+    if stats['failed']:
+        log.error(str(stats['failed']) + ' rows could not be ' + ('written to ' + TABLE_NAME if LOAD_MODE == 'direct' else 'put onto EventBridge'))
+        exit(1)
+    log.info('SUCCESS: extracted ' + str(stats['rows_read']) + ' rows')
     exit(0)
 
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,259 @@
+import queue
+import random
+import threading
+import time
+
+from logger import get_logger
+
+# PutEvents limits, https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-putevent-size.html
+MAX_ENTRIES = 10
+MAX_REQUEST_BYTES = 256 * 1024
+
+THROTTLE_ERRORS = ('ThrottlingException', 'TooManyRequestsException')
+
+# Throttled calls are retried until they go through (the rate limiter slows everything down
+# meanwhile) rather than counting towards max_attempts, up to this many times
+MAX_THROTTLED_ATTEMPTS = 100
+
+log = get_logger()
+
+
+def entry_size(entry):
+    # How EventBridge sizes an entry: the Time field is 14 bytes, the string fields count their utf-8 bytes
+    size = 14 if 'Time' in entry else 0
+    for field in ['Source', 'DetailType', 'Detail', 'EventBusName']:
+        if entry.get(field):
+            size += len(entry[field].encode('utf-8'))
+    for resource in entry.get('Resources', []):
+        size += len(resource.encode('utf-8'))
+    return size
+
+
+class EventPublisher:
+    """
+    Packs entries into PutEvents calls of up to 10 entries and 256KB and sends them from a pool of
+    `workers` threads, so the reader can keep parsing while calls are in flight. Full batches wait
+    in a queue of at most `queue_batches`; when the publishers fall behind add() blocks, which keeps
+    memory bounded however fast rows are read. With no workers batches are sent inline.
+
+    When a call reports failed entries only those are sent again, with exponential backoff and
+    jitter, up to max_attempts. Entries that still fail after that are counted in `failed` rather
+    than stopping the extraction. Entries that can never be sent (see reject()) are counted in both
+    `failed` and `rejected`.
+
+    Each entry can be added with a `mark` (where the reader had got to), and with a `watermark`
+    every batch is acknowledged with the mark of its last entry once all of it has gone out.
+
+    With a `rate_limiter` every call waits for its entries' worth of tokens first, and tells the
+    limiter whether it was throttled (or had failed entries) so the rate adapts. Throttled entries
+    are retried without using up their attempts, so throttling slows the extraction rather than
+    losing rows. Every `metrics_seconds` a metric line with the rate, retries and backlog is logged.
+
+    Subclasses can send somewhere else by overriding send() and the batch limits below.
+    """
+
+    max_entries = MAX_ENTRIES
+    max_request_bytes = MAX_REQUEST_BYTES
+    max_entry_bytes = MAX_REQUEST_BYTES
+    metric = 'publisher'
+
+    def __init__(self, event_bridge, workers=0, queue_batches=None, max_attempts=5, base_delay=0.1, max_delay=5.0,
+                 sleep=time.sleep, watermark=None, rate_limiter=None, metrics_seconds=None):
+        self.event_bridge = event_bridge
+        self.watermark = watermark
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_mark = None
+
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.calls = 0
+        self.published = 0
+        self.retried = 0
+        self.throttled = 0
+        self.failed = 0
+        self.rejected = 0
+        # Time the reader spent blocked on a full queue, and the publishers spent in PutEvents
+        self.blocked_seconds = 0.0
+        self.publish_seconds = 0.0
+        self.error = None
+
+        self.queue = queue.Queue(maxsize=queue_batches or workers * 2) if workers else None
+        self.threads = [threading.Thread(target=self.run, name='publisher-' + str(i), daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+        self.closed = threading.Event()
+        self.metrics_thread = None
+        if metrics_seconds:
+            self.metrics_thread = threading.Thread(target=self.report, args=(metrics_seconds,), name='metrics', daemon=True)
+            self.metrics_thread.start()
+
+    def add(self, entry, mark=None):
+        self.check()
+        size = self.size(entry)
+        if size > self.max_entry_bytes:
+            log.error('entry of ' + str(size) + ' bytes is over the limit of ' + str(self.max_entry_bytes) + ', skipping it')
+            self.reject(mark)
+            return
+        if len(self.pending) == self.max_entries or self.pending_bytes + size > self.max_request_bytes:
+            self.flush()
+        self.pending.append(entry)
+        self.pending_bytes += size
+        self.pending_mark = mark
+
+    def reject(self, mark=None):
+        # Counts an entry that can never be sent as failed without sending it. Sending it again on a
+        # restart would fail the same way, so it is acknowledged and the watermark moves past it
+        self.flush()
+        with self.lock:
+            self.failed += 1
+            self.rejected += 1
+        if self.watermark is not None:
+            self.watermark.acknowledge(self.watermark.issue(), mark)
+
+    def size(self, entry):
+        return entry_size(entry)
+
+    def check(self):
+        # Once a publisher has hit an error there is no point reading any more of the object
+        if self.error is not None:
+            raise self.error
+
+    def flush(self):
+        self.check()
+        entries = self.pending
+        mark = self.pending_mark
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_mark = None
+        if not entries:
+            return
+        seq = self.watermark.issue() if self.watermark is not None else None
+        if self.queue is None:
+            self.publish(seq, entries, mark)
+            return
+        started = time.monotonic()
+        self.queue.put((seq, entries, mark))
+        self.blocked_seconds += time.monotonic() - started
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            seq, entries, mark = batch
+            # Once a publisher has hit an error the rest of the queue is drained so the reader never blocks forever
+            if self.error is None:
+                try:
+                    self.publish(seq, entries, mark)
+                except Exception as error:
+                    self.error = error
+            if self.error is not None:
+                with self.lock:
+                    self.failed += len(entries)
+
+    def publish(self, seq, entries, mark):
+        if self.send(entries) and self.watermark is not None:
+            self.watermark.acknowledge(seq, mark)
+
+    def send(self, entries):
+        # Returns whether every entry went out
+        attempt = 0
+        throttled_attempts = 0
+        while attempt < self.max_attempts and throttled_attempts < MAX_THROTTLED_ATTEMPTS:
+            if attempt or throttled_attempts:
+                with self.lock:
+                    self.retried += len(entries)
+                self.sleep(self.backoff(attempt + throttled_attempts))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(len(entries))
+
+            started = time.monotonic()
+            try:
+                response = self.event_bridge.put_events(Entries=entries)
+            except Exception as error:
+                # A throttled call as a whole is retried like throttled entries, anything else is a real error
+                if error_code(error) not in THROTTLE_ERRORS:
+                    raise
+                response = {'FailedEntryCount': len(entries),
+                            'Entries': [{'ErrorCode': error_code(error)} for _ in entries]}
+            elapsed = time.monotonic() - started
+
+            # Results come back in the same order as the entries, failed ones have an ErrorCode
+            results = response['Entries'] if response.get('FailedEntryCount') else []
+            failed = [entry for entry, result in zip(entries, results) if result.get('ErrorCode')]
+            throttled = [entry for entry, result in zip(entries, results) if result.get('ErrorCode') in THROTTLE_ERRORS]
+            with self.lock:
+                self.calls += 1
+                self.publish_seconds += elapsed
+                self.published += len(entries) - len(failed)
+                self.throttled += len(throttled)
+            if self.rate_limiter is not None:
+                if failed:
+                    self.rate_limiter.throttled()
+                else:
+                    self.rate_limiter.succeeded()
+
+            entries = failed
+            if not entries:
+                return True
+            if len(throttled) == len(failed):
+                throttled_attempts += 1
+            else:
+                attempt += 1
+
+        log.error(str(len(entries)) + ' events failed after ' + str(self.max_attempts) + ' attempts')
+        with self.lock:
+            self.failed += len(entries)
+        return False
+
+    def backoff(self, attempt):
+        # Full jitter, so many tasks retrying at once don't all come back at the same moment
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def report(self, metrics_seconds):
+        while not self.closed.wait(metrics_seconds):
+            log.info(self.metric, extra={'fields': dict(self.stats(), metric=self.metric)})
+
+    def close(self):
+        if self.error is None:
+            self.flush()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.closed.set()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self.lock:
+            stats = {
+                'workers': len(self.threads),
+                'calls': self.calls,
+                'published': self.published,
+                'retried': self.retried,
+                'throttled': self.throttled,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'events_per_second': round(self.published / elapsed, 1),
+                'queued_batches': self.queue.qsize() if self.queue else 0,
+                'reader_blocked_seconds': round(self.blocked_seconds, 3),
+                'publish_seconds': round(self.publish_seconds, 3)
+            }
+        if self.rate_limiter is not None:
+            stats.update(self.rate_limiter.stats())
+        return stats
+
+
+def error_code(error):
+    # botocore's ClientError carries the service's error code in its response
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """
+    A token bucket (in entries per second) whose rate is tuned AIMD style, like TCP congestion
+    control: every `interval` of clean PutEvents calls adds `increase` to the rate, and a throttled
+    or failed call multiplies it by `decrease`, at most once per `interval` so a burst of calls
+    already in flight when throttling started only counts once. The rate settles just under
+    whatever the account's PutEvents quota lets through.
+    """
+
+    def __init__(self, rate=1000.0, min_rate=10.0, max_rate=10000.0, increase=100.0, decrease=0.5, interval=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.updated = clock()
+        self.last_increase = self.updated
+        self.last_decrease = self.updated - interval
+
+        self.waited_seconds = 0.0
+        self.decreases = 0
+
+    def acquire(self, entries):
+        # Takes the tokens straight away (going into debt if need be), then waits outside the lock
+        # until the debt is paid off, so threads are served in the order they asked
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= entries
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited_seconds += wait
+        if wait:
+            self.sleep(wait)
+
+    def succeeded(self):
+        with self.lock:
+            now = self.clock()
+            if now - self.last_increase >= self.interval and now - self.last_decrease >= self.interval:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.last_increase = now
+
+    def throttled(self):
+        with self.lock:
+            now = self.clock()
+            if now - self.last_decrease >= self.interval:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.tokens = min(self.tokens, self.rate)
+                self.last_decrease = now
+                self.last_increase = now
+                self.decreases += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'rate': round(self.rate, 1),
+                'rate_decreases': self.decreases,
+                'rate_limited_seconds': round(self.waited_seconds, 3)
+            }
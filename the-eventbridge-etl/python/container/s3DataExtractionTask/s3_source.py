@@ -0,0 +1,88 @@
+from logger import get_logger
+
+CHUNK_BYTES = 64 * 1024
+
+# Where the 'download' extraction mode puts the object
+DOWNLOAD_PATH = '/tmp/data'
+
+log = get_logger()
+
+
+class LineStream:
+    """
+    Iterates the decoded lines of a binary stream (an S3 get_object body or a local file) reading
+    it in fixed size chunks, so memory stays flat however large the object is. `offset` is the
+    byte position in the object just past what has been handed out, which after the csv reader
+    returns a row is the position just past that row. With an `end` it stops at the first line
+    starting at or after that position.
+    """
+
+    def __init__(self, stream, encoding='utf-8', chunk_bytes=CHUNK_BYTES, offset=0, end=None):
+        self.stream = stream
+        self.encoding = encoding
+        self.chunk_bytes = chunk_bytes
+        self.offset = offset
+        self.end = end
+        self.buffer = b''
+        self.position = 0
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.end is not None and self.offset >= self.end:
+            raise StopIteration
+        line = self.next_line()
+        if line is None:
+            raise StopIteration
+        # Splitting on b'\n' before decoding is safe as it never appears inside a multi byte character
+        return line.decode(self.encoding)
+
+    def skip_to(self, offset):
+        # Reads and drops whole lines up to `offset`, for resuming where a stream can't be opened part way through
+        while self.offset < offset and self.next_line() is not None:
+            pass
+
+    def next_line(self):
+        while True:
+            newline = self.buffer.find(b'\n', self.position)
+            if newline >= 0:
+                line = self.buffer[self.position:newline + 1]
+                self.position = newline + 1
+                self.offset += len(line)
+                return line
+            if self.finished:
+                if self.position == len(self.buffer):
+                    return None
+                line = self.buffer[self.position:]
+                self.position = len(self.buffer)
+                self.offset += len(line)
+                return line
+            chunk = self.stream.read(self.chunk_bytes)
+            if chunk:
+                # Only the unfinished line carries over into the next buffer
+                self.buffer = self.buffer[self.position:] + chunk
+                self.position = 0
+            else:
+                self.finished = True
+
+
+def open_object(s3, bucket_name, object_key, mode='stream', download_path=DOWNLOAD_PATH):
+    """
+    Returns a binary stream of the object. 'stream' reads the get_object body as it arrives,
+    'download' copies the whole object to local disk first (the original behaviour).
+    """
+    if mode == 'download':
+        s3.download_file(bucket_name, object_key, download_path)
+        log.info('data file downloaded: ' + download_path)
+        return open(download_path, 'rb')
+    if mode != 'stream':
+        raise ValueError('Unknown extraction mode ' + mode)
+    return s3.get_object(Bucket=bucket_name, Key=object_key)['Body']
+
+
+
+def open_range(s3, bucket_name, object_key, start):
+    # Everything from `start` to the end of the object, the reader just stops (and closes the body) once it is done
+    return s3.get_object(Bucket=bucket_name, Key=object_key, Range='bytes=' + str(start) + '-')['Body']
@@ -0,0 +1,115 @@
+import json
+import time
+
+from logger import get_logger
+from publisher import EventPublisher, error_code
+
+# BatchWriteItem limits, https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchWriteItem.html
+MAX_ITEMS = 25
+MAX_ITEM_BYTES = 400 * 1024
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+THROTTLE_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+# Unprocessed items are DynamoDB pushing back, so they are retried (with backoff, and the rate
+# limiter slowing down) until they go through, up to this many times
+MAX_WRITE_ATTEMPTS = 100
+
+log = get_logger()
+
+
+class TableWriter(EventPublisher):
+    """
+    Writes items straight into a DynamoDB table instead of putting events onto EventBridge. It
+    batches, queues and tracks the watermark just like EventPublisher, but in BatchWriteItem calls
+    of 25 put requests sent from the pool of worker threads. Items DynamoDB leaves unprocessed are
+    sent again with backoff (and slow the rate limiter down) until every one is written.
+
+    BatchWriteItem rejects a call with two puts for the same key, so only the last item for each
+    key in a batch is sent, as if it had overwritten the others with putItem. Items without a
+    value for every one of `key_names` are counted as failed rather than sent.
+    """
+
+    max_entries = MAX_ITEMS
+    max_request_bytes = MAX_BATCH_BYTES
+    max_entry_bytes = MAX_ITEM_BYTES
+    metric = 'table_writer'
+
+    def __init__(self, dynamodb, table_name, key_names=('id',), **kwargs):
+        super().__init__(None, **kwargs)
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.key_names = key_names
+        self.overwritten = 0
+
+    def key(self, request):
+        item = request['PutRequest']['Item']
+        return tuple(json.dumps(item.get(name), sort_keys=True) for name in self.key_names)
+
+    def add(self, entry, mark=None):
+        item = entry['PutRequest']['Item']
+        if not all(item.get(name) and list(item[name].values())[0] for name in self.key_names):
+            log.error('item has no ' + '/'.join(self.key_names) + ', skipping it')
+            self.reject(mark)
+            return
+        super().add(entry, mark)
+
+    def flush(self):
+        latest = {}
+        for request in self.pending:
+            latest[self.key(request)] = request
+        if len(latest) < len(self.pending):
+            self.overwritten += len(self.pending) - len(latest)
+            self.pending = list(latest.values())
+        super().flush()
+
+    def size(self, entry):
+        # Close enough to DynamoDB's own item size for batching, it's the names plus the values
+        return len(json.dumps(entry))
+
+    def send(self, requests):
+        # Returns whether every item was written
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            if attempt:
+                with self.lock:
+                    self.retried += len(requests)
+                self.sleep(self.backoff(attempt))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(len(requests))
+
+            started = time.monotonic()
+            try:
+                response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+                unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except Exception as error:
+                if error_code(error) not in THROTTLE_ERRORS:
+                    raise
+                unprocessed = requests
+            elapsed = time.monotonic() - started
+
+            with self.lock:
+                self.calls += 1
+                self.publish_seconds += elapsed
+                self.published += len(requests) - len(unprocessed)
+                self.throttled += len(unprocessed)
+            if self.rate_limiter is not None:
+                if unprocessed:
+                    self.rate_limiter.throttled()
+                else:
+                    self.rate_limiter.succeeded()
+
+            requests = unprocessed
+            if not requests:
+                return True
+
+        log.error(str(len(requests)) + ' items were still unprocessed after ' + str(MAX_WRITE_ATTEMPTS) + ' attempts')
+        with self.lock:
+            self.failed += len(requests)
+        return False
+
+    def stats(self):
+        stats = super().stats()
+        stats['items_per_second'] = stats.pop('events_per_second')
+        stats['overwritten'] = self.overwritten
+        stats['table'] = self.table_name
+        return stats
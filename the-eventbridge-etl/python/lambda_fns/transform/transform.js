@@ -3,33 +3,101 @@ Object.defineProperty(exports, "__esModule", { value: true });
 const AWS = require('aws-sdk');
 AWS.config.region = process.env.AWS_REGION || 'us-east-1';
 const eventbridge = new AWS.EventBridge();
-exports.handler = async (event) => {
-    console.log(JSON.stringify(event, null, 2));
-    const headers = event.detail.headers;
-    const data = event.detail.data;
-    let headerArray = headers.split(',');
+// Transformed blocks are split so every event stays well under the 256KB PutEvents limit
+const MAX_DETAIL_BYTES = 200 * 1024;
+const MAX_ENTRIES = 10;
+const MAX_REQUEST_BYTES = 256 * 1024;
+function transformRow(headerArray, data) {
     let dataArray = data.split(',');
     let transformedObject = {};
     for (let index in headerArray) {
         transformedObject[headerArray[index]] = dataArray[index];
     }
+    return transformedObject;
+}
+// How EventBridge sizes an entry: the Time field is 14 bytes, the string fields count their utf-8 bytes
+function entrySize(entry) {
+    let size = entry.Time ? 14 : 0;
+    for (let field of ['Source', 'DetailType', 'Detail', 'EventBusName']) {
+        if (entry[field]) {
+            size += Buffer.byteLength(entry[field]);
+        }
+    }
+    return size;
+}
+// PutEvents takes at most 10 entries and 256KB per call, so the entries are grouped by both
+function requests(entries) {
+    let groups = [];
+    let group = [];
+    let groupBytes = 0;
+    for (let entry of entries) {
+        let size = entrySize(entry);
+        if (group.length > 0 && (group.length === MAX_ENTRIES || groupBytes + size > MAX_REQUEST_BYTES)) {
+            groups.push(group);
+            group = [];
+            groupBytes = 0;
+        }
+        group.push(entry);
+        groupBytes += size;
+    }
+    if (group.length > 0) {
+        groups.push(group);
+    }
+    return groups;
+}
+function transformEntry(data) {
+    return {
+        DetailType: 'transform',
+        EventBusName: 'default',
+        Source: 'cdkpatterns.the-eventbridge-etl',
+        Time: new Date(),
+        // Main event body
+        Detail: JSON.stringify({
+            status: 'transformed',
+            data: data
+        })
+    };
+}
+exports.handler = async (event) => {
+    const headers = event.detail.headers;
+    let headerArray = headers.split(',');
+    // A packed event carries a block of rows that share one headers string
+    if (Array.isArray(event.detail.rows)) {
+        console.log('transforming a block of ' + event.detail.rows.length + ' rows');
+        let entries = [];
+        let block = [];
+        let blockBytes = 0;
+        for (let row of event.detail.rows) {
+            let transformedObject = transformRow(headerArray, row);
+            let size = Buffer.byteLength(JSON.stringify(transformedObject)) + 1;
+            if (block.length > 0 && blockBytes + size > MAX_DETAIL_BYTES) {
+                entries.push(transformEntry(block));
+                block = [];
+                blockBytes = 0;
+            }
+            block.push(transformedObject);
+            blockBytes += size;
+        }
+        if (block.length > 0) {
+            entries.push(transformEntry(block));
+        }
+        for (let group of requests(entries)) {
+            const result = await eventbridge.putEvents({ Entries: group }).promise();
+            console.log(result);
+            if (result.FailedEntryCount > 0) {
+                throw new Error(result.FailedEntryCount + ' transformed blocks could not be put onto EventBridge');
+            }
+        }
+        return;
+    }
+    console.log(JSON.stringify(event, null, 2));
+    const data = event.detail.data;
     // Building our transform event for EventBridge
     var params = {
         Entries: [
-            {
-                DetailType: 'transform',
-                EventBusName: 'default',
-                Source: 'cdkpatterns.the-eventbridge-etl',
-                Time: new Date(),
-                // Main event body
-                Detail: JSON.stringify({
-                    status: 'transformed',
-                    data: transformedObject
-                })
-            }
+            transformEntry(transformRow(headerArray, data))
         ]
     };
     const result = await eventbridge.putEvents(params).promise();
     console.log(result);
 };
-//# sourceMappingURL=data:application/json;base64,eyJ2ZXJzaW9uIjozLCJmaWxlIjoidHJhbnNmb3JtLmpzIiwic291cmNlUm9vdCI6IiIsInNvdXJjZXMiOlsidHJhbnNmb3JtLnRzIl0sIm5hbWVzIjpbXSwibWFwcGluZ3MiOiI7O0FBQUEsTUFBTSxHQUFHLEdBQUcsT0FBTyxDQUFDLFNBQVMsQ0FBQyxDQUFBO0FBRTlCLEdBQUcsQ0FBQyxNQUFNLENBQUMsTUFBTSxHQUFHLE9BQU8sQ0FBQyxHQUFHLENBQUMsVUFBVSxJQUFJLFdBQVcsQ0FBQTtBQUN6RCxNQUFNLFdBQVcsR0FBRyxJQUFJLEdBQUcsQ0FBQyxXQUFXLEVBQUUsQ0FBQTtBQUV6QyxPQUFPLENBQUMsT0FBTyxHQUFHLEtBQUssRUFBRSxLQUFTLEVBQUUsRUFBRTtJQUNsQyxPQUFPLENBQUMsR0FBRyxDQUFDLElBQUksQ0FBQyxTQUFTLENBQUMsS0FBSyxFQUFFLElBQUksRUFBRSxDQUFDLENBQUMsQ0FBQyxDQUFBO0lBRTNDLE1BQU0sT0FBTyxHQUFVLEtBQUssQ0FBQyxNQUFNLENBQUMsT0FBTyxDQUFDO0lBQzVDLE1BQU0sSUFBSSxHQUFVLEtBQUssQ0FBQyxNQUFNLENBQUMsSUFBSSxDQUFDO0lBRXRDLElBQUksV0FBVyxHQUFHLE9BQU8sQ0FBQyxLQUFLLENBQUMsR0FBRyxDQUFDLENBQUM7SUFDckMsSUFBSSxTQUFTLEdBQUcsSUFBSSxDQUFDLEtBQUssQ0FBQyxHQUFHLENBQUMsQ0FBQztJQUNoQyxJQUFJLGlCQUFpQixHQUFPLEVBQUUsQ0FBQztJQUUvQixLQUFJLElBQUksS0FBSyxJQUFJLFdBQVcsRUFBRTtRQUMxQixpQkFBaUIsQ0FBQyxXQUFXLENBQUMsS0FBSyxDQUFDLENBQUMsR0FBRyxTQUFTLENBQUMsS0FBSyxDQUFDLENBQUM7S0FDNUQ7SUFFRCwrQ0FBK0M7SUFDL0MsSUFBSSxNQUFNLEdBQUc7UUFDVCxPQUFPLEVBQUU7WUFDUDtnQkFDRSxVQUFVLEVBQUUsV0FBVztnQkFDdkIsWUFBWSxFQUFFLFNBQVM7Z0JBQ3ZCLE1BQU0sRUFBRSxpQ0FBaUM7Z0JBQ3pDLElBQUksRUFBRSxJQUFJLElBQUksRUFBRTtnQkFDaEIsa0JBQWtCO2dCQUNsQixNQUFNLEVBQUUsSUFBSSxDQUFDLFNBQVMsQ0FBQztvQkFDckIsTUFBTSxFQUFFLGFBQWE7b0JBQ3JCLElBQUksRUFBRSxpQkFBaUI7aUJBQ3hCLENBQUM7YUFDSDtTQUNGO0tBQ0osQ0FBQztJQUVGLE1BQU0sTUFBTSxHQUFHLE1BQU0sV0FBVyxDQUFDLFNBQVMsQ0FBQyxNQUFNLENBQUMsQ0FBQyxPQUFPLEVBQUUsQ0FBQztJQUM3RCxPQUFPLENBQUMsR0FBRyxDQUFDLE1BQU0sQ0FBQyxDQUFDO0FBRXhCLENBQUMsQ0FBQSIsInNvdXJjZXNDb250ZW50IjpbImNvbnN0IEFXUyA9IHJlcXVpcmUoJ2F3cy1zZGsnKVxuZXhwb3J0e307XG5BV1MuY29uZmlnLnJlZ2lvbiA9IHByb2Nlc3MuZW52LkFXU19SRUdJT04gfHwgJ3VzLWVhc3QtMSdcbmNvbnN0IGV2ZW50YnJpZGdlID0gbmV3IEFXUy5FdmVudEJyaWRnZSgpXG5cbmV4cG9ydHMuaGFuZGxlciA9IGFzeW5jIChldmVudDphbnkpID0+IHtcbiAgICBjb25zb2xlLmxvZyhKU09OLnN0cmluZ2lmeShldmVudCwgbnVsbCwgMikpXG5cbiAgICBjb25zdCBoZWFkZXJzOnN0cmluZyA9IGV2ZW50LmRldGFpbC5oZWFkZXJzO1xuICAgIGNvbnN0IGRhdGE6c3RyaW5nID0gZXZlbnQuZGV0YWlsLmRhdGE7XG5cbiAgICBsZXQgaGVhZGVyQXJyYXkgPSBoZWFkZXJzLnNwbGl0KCcsJyk7XG4gICAgbGV0IGRhdGFBcnJheSA9IGRhdGEuc3BsaXQoJywnKTtcbiAgICBsZXQgdHJhbnNmb3JtZWRPYmplY3Q6YW55ID0ge307XG5cbiAgICBmb3IobGV0IGluZGV4IGluIGhlYWRlckFycmF5KSB7XG4gICAgICAgIHRyYW5zZm9ybWVkT2JqZWN0W2hlYWRlckFycmF5W2luZGV4XV0gPSBkYXRhQXJyYXlbaW5kZXhdO1xuICAgIH1cblxuICAgIC8vIEJ1aWxkaW5nIG91ciB0cmFuc2Zvcm0gZXZlbnQgZm9yIEV2ZW50QnJpZGdlXG4gICAgdmFyIHBhcmFtcyA9IHtcbiAgICAgICAgRW50cmllczogW1xuICAgICAgICAgIHtcbiAgICAgICAgICAgIERldGFpbFR5cGU6ICd0cmFuc2Zvcm0nLFxuICAgICAgICAgICAgRXZlbnRCdXNOYW1lOiAnZGVmYXVsdCcsXG4gICAgICAgICAgICBTb3VyY2U6ICdjZGtwYXR0ZXJucy50aGUtZXZlbnRicmlkZ2UtZXRsJyxcbiAgICAgICAgICAgIFRpbWU6IG5ldyBEYXRlKCksXG4gICAgICAgICAgICAvLyBNYWluIGV2ZW50IGJvZHlcbiAgICAgICAgICAgIERldGFpbDogSlNPTi5zdHJpbmdpZnkoe1xuICAgICAgICAgICAgICBzdGF0dXM6ICd0cmFuc2Zvcm1lZCcsXG4gICAgICAgICAgICAgIGRhdGE6IHRyYW5zZm9ybWVkT2JqZWN0XG4gICAgICAgICAgICB9KVxuICAgICAgICAgIH1cbiAgICAgICAgXVxuICAgIH07XG4gICAgXG4gICAgY29uc3QgcmVzdWx0ID0gYXdhaXQgZXZlbnRicmlkZ2UucHV0RXZlbnRzKHBhcmFtcykucHJvbWlzZSgpO1xuICAgIGNvbnNvbGUubG9nKHJlc3VsdCk7XG5cbn0iXX0=
\ No newline at end of file
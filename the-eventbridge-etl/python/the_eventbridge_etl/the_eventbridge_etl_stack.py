@@ -26,14 +26,38 @@ class TheEventbridgeEtlStack(core.Stack):
         # why we are limiting concurrency to 2 on all 3 lambdas. Feel free to raise this.
         lambda_throttle_size = 2
 
+        # Set to True to have the extraction task put blocks of rows in each event rather than one
+        # event per row, the transform and load lambdas then handle a whole block per invocation
+        pack_rows = False
+        etl_lambda_timeout = core.Duration.seconds(30 if pack_rows else 3)
+
+        # Set to 'direct' for bulk backfills: the extraction task transforms rows itself and writes them
+        # straight into the table, putting only a summary event per file onto EventBridge
+        load_mode = 'events'
+
         ####
         # DynamoDB Table
         # This is where our transformed data ends up
         ####
         table = dynamo_db.Table(self, "TransformedData",
-                                partition_key=dynamo_db.Attribute(name="id", type=dynamo_db.AttributeType.STRING)
+                                partition_key=dynamo_db.Attribute(name="id", type=dynamo_db.AttributeType.STRING),
+                                # the default 5 write capacity units would throttle a direct bulk load to a crawl
+                                billing_mode=dynamo_db.BillingMode.PAY_PER_REQUEST if load_mode == 'direct'
+                                else dynamo_db.BillingMode.PROVISIONED
                                 )
 
+        ####
+        # DynamoDB Checkpoint Table
+        # The extraction task records how far through each file it has got, so a task that
+        # dies part way through a large file can be restarted without starting again
+        ####
+        checkpoint_table = dynamo_db.Table(self, "ExtractionCheckpoints",
+                                           partition_key=dynamo_db.Attribute(name="id", type=dynamo_db.AttributeType.STRING),
+                                           billing_mode=dynamo_db.BillingMode.PAY_PER_REQUEST,
+                                           time_to_live_attribute="expires",
+                                           removal_policy=core.RemovalPolicy.DESTROY
+                                           )
+
         ####
         # S3 Landing Bucket
         # This is where the user uploads the file to be transformed
@@ -66,6 +90,9 @@ class TheEventbridgeEtlStack(core.Stack):
 
         cluster = ecs.Cluster(self, 'Ec2Cluster', vpc=vpc)
 
+        # The container reads rows on one thread and sends them to EventBridge from this many
+        publisher_workers = 8
+
         task_definition = ecs.TaskDefinition(self, 'FargateTaskDefinition',
                                              memory_mib="512",
                                              cpu="256",
@@ -75,13 +102,29 @@ class TheEventbridgeEtlStack(core.Stack):
         task_definition.add_to_task_role_policy(event_bridge_put_policy)
         # Grant fargate container access to the object that was uploaded to s3
         bucket.grant_read(task_definition.task_role)
+        # and to keep its checkpoints
+        checkpoint_table.grant_read_write_data(task_definition.task_role)
+        # and, when it loads rows itself, to write them to the table
+        if load_mode == 'direct':
+            table.grant_write_data(task_definition.task_role)
 
         container = task_definition.add_container('AppContainer',
                                                   image=ecs.ContainerImage.from_asset('container/s3DataExtractionTask'),
                                                   logging=logging,
                                                   environment={
                                                       'S3_BUCKET_NAME': bucket.bucket_name,
-                                                      'S3_OBJECT_KEY': ''
+                                                      'S3_OBJECT_KEY': '',
+                                                      # 'stream' parses the object as it arrives, 'download' copies it to /tmp first
+                                                      'EXTRACTION_MODE': 'stream',
+                                                      # threads sending PutEvents batches in parallel
+                                                      'PUBLISHER_WORKERS': str(publisher_workers),
+                                                      'PACK_ROWS': str(pack_rows).lower(),
+                                                      'CHECKPOINT_TABLE': checkpoint_table.table_name,
+                                                      # 'events' hands rows to the transform and load lambdas, 'direct' writes them to TABLE_NAME
+                                                      'LOAD_MODE': load_mode,
+                                                      'TABLE_NAME': table.table_name,
+                                                      # DEBUG also logs a sample (LOG_SAMPLE_RATE) of the rows read
+                                                      'LOG_LEVEL': 'INFO'
                                                   })
 
         ####
@@ -112,9 +155,18 @@ class TheEventbridgeEtlStack(core.Stack):
                                               "CLUSTER_NAME": cluster.cluster_name,
                                               "TASK_DEFINITION": task_definition.task_definition_arn,
                                               "SUBNETS": json.dumps(subnet_ids),
-                                              "CONTAINER_NAME": container.container_name
-                                          }
+                                              "CONTAINER_NAME": container.container_name,
+                                              # objects over 512MB are split into ranges of about 256MB,
+                                              # each extracted by its own task (at most 10 per object)
+                                              "RANGE_SPLIT_BYTES": str(512 * 1024 * 1024),
+                                              "RANGE_BYTES": str(256 * 1024 * 1024),
+                                              "MAX_RANGE_TASKS": "10"
+                                          },
+                                          # starting a task per range takes longer than the default 3 seconds
+                                          timeout=core.Duration.seconds(30)
                                           )
+        # The extract lambda looks at the size of each new object to decide how to split it
+        bucket.grant_read(extract_lambda)
         queue.grant_consume_messages(extract_lambda)
         extract_lambda.add_event_source(_event.SqsEventSource(queue=queue))
         extract_lambda.add_to_role_policy(event_bridge_put_policy)
@@ -140,7 +192,7 @@ class TheEventbridgeEtlStack(core.Stack):
                                             handler="transform.handler",
                                             code=_lambda.Code.from_asset("lambda_fns/transform"),
                                             reserved_concurrent_executions=lambda_throttle_size,
-                                            timeout=core.Duration.seconds(3)
+                                            timeout=etl_lambda_timeout
                                             )
         transform_lambda.add_to_role_policy(event_bridge_put_policy)
 
@@ -164,7 +216,7 @@ class TheEventbridgeEtlStack(core.Stack):
                                        handler="load.handler",
                                        code=_lambda.Code.from_asset("lambda_fns/load"),
                                        reserved_concurrent_executions=lambda_throttle_size,
-                                       timeout=core.Duration.seconds(3),
+                                       timeout=etl_lambda_timeout,
                                        environment={
                                            "TABLE_NAME": table.table_name
                                        }